@@ -1,28 +1,39 @@
+import binascii
+import struct
 from collections import namedtuple
-from typing import List, Tuple
+from typing import Dict, List, Optional, Tuple, Union
 
 import ODriveCANSimple.enums as enums
-from ODriveCANSimple.data_type import SignedInt32, ODriveCANDataType, UnsignedInt32, FloatIEEE754
+from ODriveCANSimple.data_type import SignedInt32, SignedInt16, ODriveCANDataType, UnsignedInt32, FloatIEEE754
 from ODriveCANSimple.exceptions import *
-from ODriveCANSimple.helper import as_ascii
 
 PAYLOAD_SIZE = 8
+MAX_NODE_ID = 0x3f
+VEL_FF_SCALE = 10  # MSG_SET_POS_SETPOINT VelFF is in 0.1 counts/s
+CUR_FF_SCALE = 100  # MSG_SET_POS_SETPOINT CurFF is in 0.01 A
 
 
 class ODriveCANCommand:
-    def __init__(self, name, command_code, *params, call_and_response=False, response_code=None):
+    def __init__(self, name, command_code, *params, optional_params=(), call_and_response=False, response_code=None):
         self.name = name
         self.command_code = command_code
         self._params = tuple(params)  # type: Tuple[ODriveCANDataType]
+        # trailing params that are sent as zero when omitted
+        self._optional_params = tuple(optional_params)  # type: Tuple[ODriveCANDataType]
         self.call_and_response = call_and_response
         self.response_code = response_code
-        # TODO optional params
 
     @property
     def param_defs(self):
         if self.call_and_response:
             return ()
-        return self._params
+        return self._params + self._optional_params
+
+    @property
+    def required_param_count(self):
+        if self.call_and_response:
+            return 0
+        return len(self._params)
 
     @property
     def response_defs(self):
@@ -30,7 +41,8 @@ class ODriveCANCommand:
 
 
 SUPPORTED_COMMANDS = [
-    ODriveCANCommand('setpos', enums.MSG_SET_POS_SETPOINT, SignedInt32),
+    ODriveCANCommand('setpos', enums.MSG_SET_POS_SETPOINT, SignedInt32, optional_params=(SignedInt16, SignedInt16)),
+    ODriveCANCommand('setpos_ff', enums.MSG_SET_POS_SETPOINT, SignedInt32, SignedInt16, SignedInt16),
     ODriveCANCommand('encoder', enums.MSG_GET_ENCODER_COUNT, SignedInt32, SignedInt32,
                      call_and_response=True),
     ODriveCANCommand('state', enums.MSG_SET_AXIS_REQUESTED_STATE, SignedInt32),
@@ -43,20 +55,84 @@ SUPPORTED_COMMANDS = [
 ]
 
 
+def compile_struct(data_types) -> struct.Struct:
+    fmt = '<' + ''.join(data_type.format.lstrip('<') for data_type in data_types)
+    compiled = struct.Struct(fmt)
+    if compiled.size > PAYLOAD_SIZE:
+        raise ODriveCANPacketException('payload is too long')
+    return compiled
+
+
+class CompiledCommand:
+    def __init__(self, cmd_def: ODriveCANCommand):
+        self.definition = cmd_def
+        self.name = cmd_def.name
+        self.command_code = cmd_def.command_code
+        self.response_code = cmd_def.response_code if cmd_def.response_code is not None else cmd_def.command_code
+        self.is_remote = cmd_def.call_and_response
+        self.parsers = tuple(param_def.parser for param_def in cmd_def.param_defs)
+        self.required_param_count = cmd_def.required_param_count
+        self.param_struct = compile_struct(cmd_def.param_defs)
+        self.response_struct = compile_struct(cmd_def.response_defs)
+        self.padding = bytes(PAYLOAD_SIZE - self.param_struct.size)
+        # SLCAN header ('t' + 3 hex digit CAN ID + DLC) for every possible node
+        self.can_ids = tuple(self.can_id(node_id) for node_id in range(MAX_NODE_ID + 1))
+        self.headers = tuple(b't%03x8' % self.can_id(node_id) for node_id in range(MAX_NODE_ID + 1))
+        self.remote_frames = tuple(b'T%03x8\r' % self.can_id(node_id) for node_id in range(MAX_NODE_ID + 1))
+
+    def can_id(self, node_id):
+        return (node_id << 5) + self.command_code
+
+    def pack(self, params) -> bytes:
+        values = [parse(param) for parse, param in zip(self.parsers, params)]
+        if len(values) < self.required_param_count:
+            raise ODriveCANPacketException('{} needs {} params'.format(self.name, self.required_param_count))
+        if len(values) < len(self.parsers):
+            values.extend([0] * (len(self.parsers) - len(values)))
+        return self.param_struct.pack(*values) + self.padding
+
+    def unpack(self, payload: bytes) -> List[any]:
+        return list(self.response_struct.unpack_from(payload))
+
+    def encode(self, node_id, params=()) -> bytes:
+        if self.is_remote:
+            return self.remote_frames[node_id]
+        return self.headers[node_id] + binascii.hexlify(self.pack(params)) + b'\r'
+
+    def frame(self, node_id, payload: Optional[bytes]) -> bytes:
+        # for callers that keep the packed payload, e.g. to record it; None for a remote frame
+        if payload is None:
+            return self.remote_frames[node_id]
+        return self.headers[node_id] + binascii.hexlify(payload) + b'\r'
+
+    def __repr__(self):
+        return "{}:{}".format(self.__class__.__name__, self.name)
+
+
+def compile_command_tables(commands) -> Tuple[Dict[str, CompiledCommand], Dict[int, CompiledCommand]]:
+    by_name = {cmd.name: CompiledCommand(cmd) for cmd in commands}
+    by_command_code = {compiled.command_code: compiled for compiled in reversed(list(by_name.values()))}
+    by_code = {compiled.response_code: compiled for compiled in reversed(list(by_name.values()))}
+    # command codes take precedence over response codes
+    by_code.update(by_command_code)
+    return by_name, by_code
+
+
+COMMANDS_BY_NAME, COMMANDS_BY_CODE = compile_command_tables(SUPPORTED_COMMANDS)
+
+
 def find_command_definition_by_name(cmd_name):
-    names = [cmd.name for cmd in SUPPORTED_COMMANDS]
-    idx = names.index(cmd_name)
-    return SUPPORTED_COMMANDS[idx]
+    try:
+        return COMMANDS_BY_NAME[cmd_name].definition
+    except KeyError:
+        raise ValueError(cmd_name)
 
 
 def find_command_definition_by_code(cmd_code):
     try:
-        codes = [cmd.command_code for cmd in SUPPORTED_COMMANDS]
-        idx = codes.index(cmd_code)
-    except ValueError:
-        codes = [cmd.response_code for cmd in SUPPORTED_COMMANDS]
-        idx = codes.index(cmd_code)
-    return SUPPORTED_COMMANDS[idx]
+        return COMMANDS_BY_CODE[cmd_code].definition
+    except KeyError:
+        raise ValueError(cmd_code)
 
 
 MethodValuePair = namedtuple('MethodValuePair', ['method', 'value'])
@@ -64,106 +140,63 @@ MethodValuePair = namedtuple('MethodValuePair', ['method', 'value'])
 
 class ODriveCANInterface:
     def __init__(self):
-        self.encoder = encode_sCAN
-        self.decoder = decode_sCAN
+        self.decoder = decode_slcan
         self.known_commands = [cmd_def.name for cmd_def in SUPPORTED_COMMANDS]
+        self.commands = COMMANDS_BY_NAME
+        self.responses = COMMANDS_BY_CODE
+
+    def process_command(self, command_tokens) -> str:
+        return self.encode_command(command_tokens).decode()
 
-    def process_command(self, command_tokens):
+    def encode_command(self, command_tokens) -> bytes:
+        node_id, cmd = self.resolve_command(command_tokens)
+        return cmd.encode(node_id, command_tokens[2:])
+
+    def resolve_command(self, command_tokens) -> Tuple[int, CompiledCommand]:
         node_id = int(command_tokens[0])
-        cmd_name = command_tokens[1]
-        cmd_params = command_tokens[2:]
-        if node_id > 0x3f:
+        if not 0 <= node_id <= MAX_NODE_ID:
             raise ODriveCANInvalidNodeID
-        if command_tokens[1] not in self.known_commands:
+        try:
+            return node_id, self.commands[command_tokens[1]]
+        except KeyError:
             raise ODriveCANUnsupportedCommand
-        cmd_def = find_command_definition_by_name(cmd_name)
-        is_remote = cmd_def.call_and_response
-        packet = ODriveCANPacket(node_id, cmd_def.command_code, is_remote)
-        params = []
-        for param_def, param_str in zip(cmd_def.param_defs, cmd_params):  # type: ODriveCANDataType.__class__, str
-            p = param_def(param_str)  # type: ODriveCANDataType
-            params.append(p)
-        for param in params:
-            packet.add_payload(param)
-        return self.encoder(packet)
-
-    def process_response(self, response_string)-> Tuple[int, int, List[any]]:
-        node_id, cmd_code, payload = self.decoder(response_string)
-        cmd_def = find_command_definition_by_code(cmd_code)  # type: ODriveCANCommand
-        assert cmd_def.call_and_response
-        return node_id, cmd_code, self.parse_response(cmd_def, payload)
-
-    def parse_response(self, cmd_def: ODriveCANCommand, payload: List[int]):
-        values = []
-        for data_type in cmd_def.response_defs:
-            value = data_type.unpack(payload[:data_type.bits])
-            payload = payload[data_type.bits:]
-            values.append(value)
-        return values
-
-
-class ODriveCANPacket:
-    def __init__(self, node_id, msg_id, is_remote=False):
-        self.node_id = node_id
-        self.msg_id = msg_id
-        self.payload = [0x00] * 8
-        self.msg_ptr = 0
-        self.is_remote = is_remote
-
-    def add_payload(self, data: ODriveCANDataType):
-        self.check_payload_size()
-        ptr = self.msg_ptr
-        for i, datum in enumerate(data.pack()):
-            self.payload[ptr + i] = datum
-        self.msg_ptr += data.bits
-
-    def check_payload_size(self):
-        if self.msg_ptr >= PAYLOAD_SIZE:
-            raise ODriveCANPacketException('payload is too long')
 
-    @property
-    def node_id_hex(self):
-        return "{0:0{1}x}".format(self.node_id, 2)
+    def process_response(self, response_frame: Union[str, bytes]) -> Tuple[int, int, List[any]]:
+        if isinstance(response_frame, str):
+            response_frame = response_frame.encode()
+        can_id, payload = self.decoder(response_frame)
+        return self.process_payload(can_id, payload)
 
-    @property
-    def msg_id_hex(self):
-        return "{0:0{1}x}".format(self.msg_id, 3)
+    def process_payload(self, can_id: int, payload: bytes) -> Tuple[int, int, List[any]]:
+        node_id = can_id >> 5
+        cmd_code = can_id & 0b00000011111
+        cmd = self.responses[cmd_code]
+        assert cmd.is_remote
+        return node_id, cmd_code, cmd.unpack(payload)
 
-    @property
-    def can_id(self):
-        return (self.node_id << 5) + self.msg_id
 
-    def __repr__(self):
-        header = "node_id:{}, msg_id:{}".format(self.node_id_hex, self.msg_id_hex)
-        payload = "payload:" + ",".join([as_ascii(byte) for byte in self.payload])
-        return header + ", " + payload
+def decode_slcan(frame: bytes) -> Tuple[int, bytes]:
+    if frame[:1] != b't':
+        raise ODriveCANPacketException('not a data frame: {!r}'.format(frame))
+    return int(frame[1:4], 16), binascii.unhexlify(frame[5:21])
 
 
-DECODE_DELIMITER = [0, 1, 4, 5, 7, 9, 11, 13, 15, 17, 19, 21]
+def encode_slcan(can_id: int, payload: bytes, is_remote=False) -> bytes:
+    if is_remote:
+        return b'T%03x8\r' % can_id
+    return b't%03x8' % can_id + binascii.hexlify(payload) + b'\r'
 
 
-def decode_sCAN(message: str):
-    if not message.startswith('t'):
+def decode_sCAN(message: Union[str, bytes]) -> Optional[Tuple[int, int, bytes]]:
+    if isinstance(message, str):
+        message = message.encode()
+    if not message.startswith(b't'):
         return
-    _, cmd_id_hex, length, *payload_hex = [message[i:j] for i, j in zip(DECODE_DELIMITER, DECODE_DELIMITER[1:])]
-    payload = [int(item, 16) for item in payload_hex]
-    cmd_id_int = int(cmd_id_hex, 16)
-    node_id = (cmd_id_int & 0b11111100000) >> 5
-    cmd_code = (cmd_id_int & 0b00000011111)
+    can_id, payload = decode_slcan(message)
+    node_id = (can_id & 0b11111100000) >> 5
+    cmd_code = (can_id & 0b00000011111)
     return node_id, cmd_code, payload
 
 
-def encode_sCAN(pkt: ODriveCANPacket):
-    frame_id = 't'
-    can_id_ascii = "{0:0{1}x}".format(pkt.can_id, 3)
-    dlc = '8'
-    data = "".join([as_ascii(byte) for byte in pkt.payload])
-    cr = '\r'
-    if pkt.is_remote:
-        frame_id = 'T'
-        return frame_id + can_id_ascii + dlc + cr
-    return frame_id + can_id_ascii + dlc + data + cr
-
-
 if __name__ == '__main__':
     pass
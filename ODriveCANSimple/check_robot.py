@@ -1,62 +1,69 @@
 import socket
-sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-sock.connect(('localhost', 1978))
-sock.settimeout(2)
 from time import sleep
 
+sock = None
+
+def connect():
+    # opened on first use so the helpers can be imported without a running server
+    global sock
+    if sock is None:
+        sock = socket.create_connection(('localhost', 1978), timeout=2)
+    return sock
+
 def send(cmd:str, recv=False):
-    sock.send(cmd.encode())
+    connection = connect()
+    connection.send(cmd.encode())
     sleep(0.05)
     if recv:
-        response = sock.recv(1024)
+        response = connection.recv(1024)
         print(response.decode())
 
+def pipeline(commands, timeout=2):
+    """Sends every command at once as '@<id> <command>', replies are matched by ID."""
+    framed = socket.create_connection(('localhost', 1978), timeout=timeout)
+    framed.send("".join("@{} {}\n".format(idx, cmd) for idx, cmd in enumerate(commands)).encode())
+    try:
+        replies = read_replies(framed, len(commands))
+    finally:
+        framed.close()
+    return [replies[idx] for idx in range(len(commands))]
+
+def read_replies(connection, count):
+    replies = dict()
+    buffer = b""
+    while len(replies) < count:
+        data = connection.recv(4096)
+        if not data:
+            raise ConnectionError("server closed the connection with {} replies outstanding".format(count - len(replies)))
+        buffer += data
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            # published events ('<topic> <joint> <values>') share the connection once subscribed
+            if not line.startswith(b"@"):
+                continue
+            request_id, _, result = line.decode()[1:].partition(" ")
+            replies[int(request_id)] = result
+    return replies
+
+
 def setup_joints():
-    template = "robot:init_joint {}"
-    send(template.format('j1'))
-    send(template.format('j2'))
-    send(template.format('j3'))
-    send(template.format('j4'))
-    send(template.format('j5'))
-    send(template.format('j6'))
-    response = sock.recv(1024)
-    print(response.decode())
+    result, = pipeline(["robot:init_all"], timeout=5)
+    print(result)
+    return result.startswith("init ok")
 
 def energize_all():
-    template = "can:{} state 8"
-    send(template.format(1))
-    send(template.format(2))
-    send(template.format(3))
-    send(template.format(4))
-    send(template.format(5))
-    send(template.format(6))
+    result, = pipeline(["robot:energize_all"])
+    print(result)
 
 def deenergize_all():
-    template = "can:{} state 1"
-    send(template.format(1))
-    send(template.format(2))
-    send(template.format(3))
-    send(template.format(4))
-    send(template.format(5))
-    send(template.format(6))
+    result, = pipeline(["robot:idle_all"])
+    print(result)
 
 def move_p1():
-    template = "can:{} setpos {}"
-    send(template.format(1, -20000))
-    send(template.format(2, -30000))
-    send(template.format(3, -30000))
-    send(template.format(4, 20000))
-    send(template.format(5, 60000))
-    send(template.format(6, 50000))
+    send("robot:pose_raw -20000 -30000 -30000 20000 60000 50000")
 
 def move_p2():
-    template = "can:{} setpos {}"
-    send(template.format(1, 20000))
-    send(template.format(2, -30000))
-    send(template.format(3, -30000))
-    send(template.format(4, -20000))
-    send(template.format(5, 60000))
-    send(template.format(6, 50000))
+    send("robot:pose_raw 20000 -30000 -30000 -20000 60000 50000")
 
 def shake():
     template = "can:{} setpos {}"
@@ -70,22 +77,10 @@ def shake():
 
 
 def move_p0():
-    template = "can:{} setpos {}"
-    send(template.format(1, 0))
-    send(template.format(2, 0))
-    send(template.format(3, 0))
-    send(template.format(4, 0))
-    send(template.format(5, 0))
-    send(template.format(6, 0))
+    send("robot:pose_raw 0 0 0 0 0 0")
 
 def move_p4():
-    template = "can:{} setpos {}"
-    send(template.format(1, -10000))
-    send(template.format(2, -10000))
-    send(template.format(3, -10000))
-    send(template.format(4, 10000))
-    send(template.format(5, 10000))
-    send(template.format(6, 10000))
+    send("robot:pose_raw -10000 -10000 -10000 10000 10000 10000")
 
 def move():
     move_p1()
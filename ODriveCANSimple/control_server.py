@@ -1,299 +1,514 @@
 from asyncio import Future
-from dataclasses import dataclass
+import argparse
+from functools import partial
 from typing import Optional, Tuple, Union, List
 import sys
+import time
 import traceback
 import ODriveCANSimple.enums as enums
 import asyncio
 import serial_asyncio
 from ODriveCANSimple.can_interface import ODriveCANInterface
+from ODriveCANSimple.correlation import ResponseCorrelator
+from ODriveCANSimple.dispatch import ResponseDispatcher
+from ODriveCANSimple.exceptions import ODriveCANAxisError, ODriveCANTimeout
+from ODriveCANSimple.framing import SLCANFrameScanner, LineScanner, DATA_FRAME
 from ODriveCANSimple.helper import valid_amt_angle
+from ODriveCANSimple.homing import EncoderReadings, HomeJoint
+from ODriveCANSimple.latency import LatencyTracker
+from ODriveCANSimple.planner import MotionPlanner
+from ODriveCANSimple.poller import AdaptivePoller
+from ODriveCANSimple.pubsub import Broker, Outbox
+from ODriveCANSimple.recorder import TelemetryRecorder
+from ODriveCANSimple.replay import ReplaySession
 from ODriveCANSimple.robot import RoboticArm, Joint
+from ODriveCANSimple.state_store import FIELD_INDEX, TELEMETRY_FIELDS
+from ODriveCANSimple.scheduler import CommandScheduler, LANE_MOTION, LANE_SAFETY
+from ODriveCANSimple.trajectory import (Trajectory, TrajectoryStreamer, velocity_feedforward, max_stream_rate,
+                                        DEFAULT_RATE)
+from ODriveCANSimple.watchdog import Watchdog
+
+CAN_BAUDRATE = 115200
+ENCODER_BAUDRATE = 115200
+LINK_BUSY_BYTES = 64  # unsent bytes on the CAN serial link that count as falling behind
+INIT_ATTEMPTS = 3  # offset writes per joint before giving up on a mismatched read-back
+STATE_TIMEOUT = 1.0  # seconds for every axis to confirm a bulk state change
+RECORDING_DIR = 'recordings'
 
 robotic_arm = RoboticArm()
-cmd_queue = asyncio.Queue(maxsize=32)
-tcp_queue = asyncio.Queue(maxsize=32)
-rsp_queue = asyncio.Queue(maxsize=32)
-
-
-@dataclass
-class ResponseFilter:
-    node_id: int
-    cmd_id: int
-    callback: any
-
-
-@dataclass
-class CANResponse:
-    node_id: int
-    cmd_id: int
-    data: List[any]
-
-
-response_filters = []  # type: List[ResponseFilter]
-response_processors = dict()
-response_processors[enums.MSG_ODRIVE_HEARTBEAT] = 'update_heartbeat'
-response_processors[enums.MSG_GET_ENCODER_COUNT] = 'update_encoder_count'
-response_processors[enums.MSG_GET_ENCODER_OFFSET] = 'update_encoder_offset'
+cmd_scheduler = CommandScheduler()
+broker = Broker()
+poller = AdaptivePoller(robotic_arm, cmd_scheduler, baudrate=CAN_BAUDRATE)
+correlator = ResponseCorrelator(cmd_scheduler)
+dispatcher = ResponseDispatcher(robotic_arm)
+planner = MotionPlanner.for_arm(robotic_arm)
+encoder_readings = EncoderReadings()
+watchdog = Watchdog(cmd_scheduler, robotic_arm.node_ids)
+latency = LatencyTracker()
+cmd_scheduler.on_enqueue = latency.enqueued
+can_server = None  # type: Optional[CANUartServer]
+recorder = None  # type: Optional[TelemetryRecorder]
+log_frames = False  # print every command and non-telemetry reply, the recorder keeps them all anyway
 
 
 class InitializeJoint:
-    def __init__(self, joint: Joint):
+    def __init__(self, joint: Joint, attempts=INIT_ATTEMPTS):
         self.joint = joint
-        self.step_idx = 0
-        self.steps = 2  # TODO count method names starting with step by introspection
+        self.attempts = attempts
+        self.ok = False
 
-    async def step0(self, *args):
+    async def __call__(self) -> str:
         self.joint.reset_state()
-        if self.joint.error > 0:
-            await tcp_queue.put(f"{self.joint.verbose_name} has error")
-            return
-        if not valid_amt_angle(self.joint.motor_angle):
-            await tcp_queue.put("invalid amt angle")
-            return
+        if self.joint.error:
+            return self.fail("has error")
+        if self.joint.motor_angle is None or not valid_amt_angle(self.joint.motor_angle):
+            return self.fail("invalid amt angle")
         self.joint.calculate_offset()
+        self.joint.encoder_is_ready.setpoint = 1
         offset = self.joint.offset.setpoint
         can_node_id = self.joint.config.can_node_id
-        await cmd_queue.put(f"{can_node_id} woffset {offset}")
-        response_filters.append(ResponseFilter(can_node_id, enums.MSG_GET_ENCODER_OFFSET, self))
-        await cmd_queue.put(f"{can_node_id} roffset")
-
-    async def step1(self, *args):
-        can_node_id = self.joint.config.can_node_id
-        can_response, *_ = args
-        print('on step 1', can_response)
-
-    async def __call__(self, can_response=None):
-        method = getattr(self, f"step{self.step_idx}")
-        self.step_idx += 1
-        await method(can_response)
+        try:
+            for _ in range(self.attempts):
+                await correlator.request(can_node_id, 'woffset', offset)
+                await correlator.request(can_node_id, 'roffset')
+                if self.verified():
+                    self.ok = True
+                    return f"{self.joint.verbose_name} offset {offset} ready 1"
+        except ODriveCANTimeout:
+            return self.fail("no reply")
+        return self.fail(f"offset {self.joint.offset.actual} ready {self.joint.encoder_is_ready.actual} "
+                         f"expected {offset}")
+
+    def verified(self) -> bool:
+        # the roffset reply has already been applied to the joint by update_encoder_offset()
+        return (self.joint.offset.actual == self.joint.offset.setpoint
+                and self.joint.encoder_is_ready.actual == self.joint.encoder_is_ready.setpoint)
+
+    def fail(self, reason: str) -> str:
+        broker.publish('errors', self.joint.verbose_name, reason)
+        return f"{self.joint.verbose_name} {reason}"
 
     def __repr__(self):
-        return f"{self.__class__.__name__}:step{self.step_idx}"
+        return f"{self.__class__.__name__}:{self.joint.verbose_name}"
 
 
 class RobotAPI:
     def __init__(self):
         self.pending = []
+        self.stream_task = None  # type: Optional[asyncio.Task]
 
-    async def run(self, command: str):
-        try:
-            method, *tokens = command.split(" ")
-            await getattr(self, method)(*tokens)
-        except Exception as e:
-            print('RobotAPI exception occured', traceback.format_exc())
+    async def call(self, command: str) -> Optional[str]:
+        method, *tokens = command.split(" ")
+        if method.startswith("_") or method == 'call':
+            raise AttributeError(method)
+        return await getattr(self, method)(*tokens)
 
     async def get_zero(self, *args):
         joint_name, = args
         joint = robotic_arm.joint(joint_name)
-        await asyncio.ensure_future(tcp_queue.put(str(joint.zero_position_in_count) + "\n"))
+        return str(joint.zero_position_in_count)
 
     async def init_joint(self, *args):
         joint_name, = args
         joint = robotic_arm.joint(joint_name)
         robot_command = InitializeJoint(joint)
-        await robot_command()
+        return await robot_command()
+
+    async def init_all(self, *args):
+        routines = [InitializeJoint(joint) for joint in robotic_arm.joints]
+        results = await asyncio.gather(*(init() for init in routines))
+        failed = sum(not init.ok for init in routines)
+        summary = "init ok" if not failed else f"init failed {failed}/{len(routines)}"
+        return "{}: {}".format(summary, ", ".join(results))
+
+    async def energize_all(self, *args):
+        return await self._request_state_all(enums.AXIS_STATE_CLOSED_LOOP_CONTROL)
+
+    async def idle_all(self, *args):
+        if self.stream_task is not None and not self.stream_task.done():
+            self.stream_task.cancel()
+        return await self._request_state_all(enums.AXIS_STATE_IDLE)
+
+    async def _request_state_all(self, state: int, timeout=STATE_TIMEOUT):
+        # waiters go in before the frames so no heartbeat can slip past them
+        joints = robotic_arm.joints
+        waits = [asyncio.ensure_future(robotic_arm.await_state(joint.config.can_node_id, state, timeout))
+                 for joint in joints]
+        for joint in joints:
+            joint.requested_state.setpoint = state
+        cmd_scheduler.put_batch([f"{joint.config.can_node_id} state {state}" for joint in joints], LANE_SAFETY)
+        sent_at = time.monotonic()
+        for joint in joints:
+            try:
+                cmd_scheduler.put_nowait(f"{joint.config.can_node_id} heartbeat")
+            except asyncio.QueueFull:
+                break  # the poller will get to it
+        results = await asyncio.gather(*waits, return_exceptions=True)
+        replies, reached = [], []
+        for joint, result in zip(joints, results):
+            if isinstance(result, (ODriveCANTimeout, ODriveCANAxisError)):
+                replies.append(f"{joint.verbose_name} failed ({result})")
+            elif isinstance(result, Exception):
+                raise result
+            else:
+                reached.append(result)
+                replies.append("{} ok {:.3f}s".format(joint.verbose_name, result - sent_at))
+                error = robotic_arm.states.errors.get(joint.config.can_node_id)
+                if error:
+                    replies[-1] += " (axis error {})".format(error)
+        summary = "state {} {}/{}".format(state, len(reached), len(joints))
+        if len(reached) > 1:
+            summary += " gap {:.3f}s".format(max(reached) - min(reached))
+        return "{}: {}".format(summary, ", ".join(replies))
+
+    async def state(self, *args):
+        # state [joint] [max_age_s]
+        if args and args[0] in robotic_arm.joints_by_name:
+            joints, args = [robotic_arm.joint(args[0])], args[1:]
+        else:
+            joints = robotic_arm.joints
+        max_age = float(args[0]) if args else None
+        if max_age is not None:
+            await asyncio.gather(*(self._refresh_state(joint, max_age) for joint in joints))
+        now = time.monotonic()
+        return ", ".join(format_joint_state(joint, now) for joint in joints)
+
+    async def state_all(self, *args):
+        return await self.state(*args)
+
+    async def _refresh_state(self, joint: Joint, max_age: float):
+        # only the polls whose fields are missing or older than max_age go on the bus
+        stale = set()
+        for field, cmd_name in TELEMETRY_FIELDS.items():
+            age = robotic_arm.store.age(field, joint.slot)
+            if cmd_name is not None and (age is None or age > max_age):
+                stale.add(cmd_name)
+        requests = [correlator.request(joint.config.can_node_id, cmd_name) for cmd_name in sorted(stale)]
+        for result in await asyncio.gather(*requests, return_exceptions=True):
+            if isinstance(result, Exception) and not isinstance(result, ODriveCANTimeout):
+                raise result
 
     async def get_target(self, *args):
         joint_name, angle = args
         joint = robotic_arm.joint(joint_name)
         target = joint.convert_angle_to_count(int(angle))
-        await asyncio.ensure_future(tcp_queue.put(str(target) + "\n"))
+        return str(target)
 
     async def goto(self, *args):
         joint_name, angle = args
         joint = robotic_arm.joint(joint_name)
         target = int(joint.convert_angle_to_count(int(angle)))
-        await cmd_queue.put(f"{joint.config.can_node_id} setpos {target}")
+        await cmd_scheduler.put(f"{joint.config.can_node_id} setpos {target}")
 
     async def home(self, *args):
         joint_name, = args
-        joint = robotic_arm.joint(joint_name)
-        if joint.no_encoder:
-            increment = 1000
-            target = joint.shadow_count
-            while True:
-                if joint.get_homing_state():
-                    homed = True
-                    break
-                target = target + increment
-                await self._set_position(joint.config.can_node_id, target)
-                await asyncio.sleep(0.2)
-        else:
-            increment = int(2 * joint.config.gear_ratio)
-            target = joint.shadow_count
-            direction_t0 = joint.get_homing_direction()
-            while True:
-                direction_now = joint.get_homing_direction()
-                if joint.get_homing_state():
-                    homed = True
-                    break
-                if direction_t0 != direction_now:
-                    homed = False
-                    print("past home")
-                    break
-                target = target + direction_t0 * increment
-                await self._set_position(joint.config.can_node_id, target)
-                await asyncio.sleep(0.2)
-        if homed:
-            print("homed")
-            joint.home_count = target
-            joint.homed = True
+        homing = HomeJoint(robotic_arm.joint(joint_name), encoder_readings, self._set_position)
+        homed = await homing()
+        print(homing.result(homed))
+        return "homed" if homed else "not homed"
+
+    async def home_all(self, *args):
+        routines = [HomeJoint(joint, encoder_readings, self._set_position) for joint in robotic_arm.joints]
+        results = await asyncio.gather(*(homing() for homing in routines))
+        return ", ".join(homing.result(homed) for homing, homed in zip(routines, results))
+
+    async def poll_report(self, *args):
+        return "\n".join(poller.report())
+
+    async def request_stats(self, *args):
+        return str(correlator.stats())
+
+    async def stats(self, *args):
+        # stats [reset]
+        report = "; ".join(latency.report()) or "no replies yet"
+        if args and args[0] == 'reset':
+            latency.reset()
+        return report
+
+    async def watchdog_stats(self, *args):
+        return str(watchdog.stats())
+
+    async def queue_stats(self, *args):
+        return str(cmd_scheduler.stats())
+
+    async def pose(self, *args):
+        if len(args) != len(robotic_arm.joints):
+            raise ValueError("pose needs one angle per joint")
+        targets = robotic_arm.convert_angles_to_counts([float(angle) for angle in args])
+        send_setpoints(targets)
+
+    async def pose_raw(self, *args):
+        if len(args) != len(robotic_arm.joints):
+            raise ValueError("pose_raw needs one count per joint")
+        send_setpoints([int(count) for count in args])
+
+    async def stream(self, *args):
+        # stream <rate_hz> <t>:<angle>,<angle>,... <t>:<angle>,<angle>,...
+        rate, *waypoints = args
+        rate = float(rate)
+        trajectory = Trajectory.parse(waypoints)
+        return await self._stream_angles(trajectory.sample(rate), rate)
+
+    async def move(self, *args):
+        # move <angle> ... <angle> [rate_hz], synchronized from the current pose
+        if len(args) not in (len(robotic_arm.joints), len(robotic_arm.joints) + 1):
+            raise ValueError("move needs one angle per joint")
+        rate = float(args[len(robotic_arm.joints)]) if len(args) > len(robotic_arm.joints) else DEFAULT_RATE
+        goal = [float(angle) for angle in args[:len(robotic_arm.joints)]]
+        # joints without an output encoder start from their motor count, poll it if init cleared it
+        unknown = [joint for joint in robotic_arm.joints if joint.no_encoder and joint.shadow_count is None]
+        await asyncio.gather(*(correlator.request(joint.config.can_node_id, 'encoder') for joint in unknown))
+        plan = planner.plan(robotic_arm.current_joint_positions, goal)
+        if not plan.duration:
+            return "already at goal"
+        return await self._stream_angles(plan.sample(rate), rate)
+
+    async def stream_stats(self, *args):
+        return str(streamer.stats)
+
+    async def plan_stats(self, *args):
+        return str(planner.stats())
+
+    async def _stream_angles(self, angles, rate):
+        setpoints = robotic_arm.convert_angles_to_counts(angles)
+        # VelFF tops out at +-3276.7 counts/s, faster segments still go out with the clipped
+        # value and the position loop covers the rest; the stream stats count them as ff_saturated
+        feedforward = velocity_feedforward(setpoints, rate)
+        if self.stream_task is not None and not self.stream_task.done():
+            self.stream_task.cancel()
+        self.stream_task = asyncio.ensure_future(streamer.stream(setpoints, rate, feedforward))
+        return str(await self.stream_task)
 
     async def _set_position(self, node_id, position):
-        await cmd_queue.put(f"{node_id} setpos {position}")
+        await cmd_scheduler.put(f"{node_id} setpos {position}")
+
+
+def format_joint_state(joint: Joint, now: float) -> str:
+    fields = []
+    for field in TELEMETRY_FIELDS:
+        age = robotic_arm.store.age(field, joint.slot, now)
+        age = "-" if age is None else "{:.0f}ms".format(age * 1000.0)
+        value = robotic_arm.store.get(FIELD_INDEX[field], joint.slot)
+        fields.append("{}={}@{}".format(field, value, age))
+    return " ".join([joint.verbose_name, *fields])
+
+
+def send_setpoints(targets, vel_ff=None):
+    if vel_ff is None:
+        commands = [f"{node_id} setpos {int(target)}" for node_id, target in zip(robotic_arm.node_ids, targets)]
+    else:
+        commands = [f"{node_id} setpos_ff {int(target)} {int(vel)} 0"
+                    for node_id, target, vel in zip(robotic_arm.node_ids, targets, vel_ff)]
+    cmd_scheduler.put_batch(commands)
+    poller.charge(len(commands))
+
+
+def can_link_busy():
+    if cmd_scheduler.batch_pending(LANE_MOTION):
+        return True
+    return can_server is not None and can_server.transport.get_write_buffer_size() > LINK_BUSY_BYTES
 
 
 robot_api = RobotAPI()
+streamer = TrajectoryStreamer(send_setpoints, can_link_busy, max_stream_rate(CAN_BAUDRATE, len(robotic_arm.joints)))
 
 
-def update_heartbeat(response: CANResponse):
-    joint = robotic_arm.search_by_can_node(response.node_id)
-    error, state = response.data
+@dispatcher.handler(enums.MSG_ODRIVE_HEARTBEAT)
+def update_heartbeat(joint: Joint, data: List[any]):
+    error, state = data
+    previous_error = joint.error
     joint.requested_state.actual = state
     joint.error = error
-
-
-def update_encoder_count(response: CANResponse):
-    joint = robotic_arm.search_by_can_node(response.node_id)
-    shadow, cpr = response.data
+    robotic_arm.states.update(joint.config.can_node_id, error, state)
+    watchdog.feed(joint.config.can_node_id, 'heartbeat')
+    if error:
+        watchdog.fault(joint.config.can_node_id, error)
+    else:
+        watchdog.clear_fault(joint.config.can_node_id)
+    broker.publish('heartbeat', joint.verbose_name, error, state)
+    if error and error != previous_error:
+        broker.publish('errors', joint.verbose_name, "axis error", error)
+
+
+@dispatcher.handler(enums.MSG_GET_ENCODER_COUNT)
+def update_encoder_count(joint: Joint, data: List[any]):
+    shadow, cpr = data
     joint.cpr = cpr
     joint.shadow_count = shadow
+    watchdog.feed(joint.config.can_node_id, 'encoder')
+    broker.publish('encoder', joint.verbose_name, shadow, cpr)
 
 
-def update_encoder_offset(response: CANResponse):
-    joint = robotic_arm.search_by_can_node(response.node_id)
-    offset, is_ready = response.data
+@dispatcher.handler(enums.MSG_GET_ENCODER_OFFSET)
+def update_encoder_offset(joint: Joint, data: List[any]):
+    offset, is_ready = data
     joint.encoder_is_ready.actual = is_ready
     joint.offset.actual = offset
     print('updated encoder offset', str(joint))
+    broker.publish('offset', joint.verbose_name, offset, is_ready)
 
 
-def process_stdin_data(queue):
-    asyncio.ensure_future(queue.put(sys.stdin.readline()))
+dispatcher.register(enums.MSG_ODRIVE_HEARTBEAT, poller.reply_handler('heartbeat'))
+dispatcher.register(enums.MSG_GET_ENCODER_COUNT, poller.reply_handler('encoder'))
+dispatcher.add_listener(correlator.resolve)
+dispatcher.add_listener(latency.replied)
+# a joint someone is waiting on reports its heartbeat at the moving rate
+robotic_arm.states.on_wait = poller.notify_motion
 
 
-async def periodic_polling():
-    await asyncio.sleep(1)
-    while True:
-        for joint in robotic_arm.joints:
-            command = "{} heartbeat".format(joint.config.can_node_id)
-            await asyncio.ensure_future(cmd_queue.put(command))
-            await asyncio.sleep(0.1)
-            command = "{} encoder".format(joint.config.can_node_id)
-            await asyncio.ensure_future(cmd_queue.put(command))
-            await asyncio.sleep(0.1)
-
-
-def find_response_filter(response: CANResponse):
-    needle = f"{response.node_id}:{response.cmd_id}"
-    haystack = [f"{f.node_id}:{f.cmd_id}" for f in response_filters]
-    if needle not in haystack:
+def process_stdin_data(queue):
+    line = sys.stdin.readline()
+    if not line:
+        # EOF, e.g. running detached or replaying from a script
+        asyncio.get_event_loop().remove_reader(sys.stdin)
         return
-    idx = haystack.index(needle)
-    return response_filters.pop(idx)
+    asyncio.ensure_future(queue.put(line))
 
 
-async def process_response():
-    while True:
-        response = await asyncio.ensure_future(rsp_queue.get())  # type: CANResponse
-        match = find_response_filter(response)
-        if match:
-            await match.callback(response)
-        elif response.cmd_id in response_processors:
-            func_name = response_processors[response.cmd_id]
-            globals()[func_name](response)
+async def can_request(command: str) -> str:
+    node_id, cmd_name, *params = command.split(" ")
+    values = await correlator.request(int(node_id), cmd_name, *params)
+    return "ok" if values is None else str(values)
 
 
 class IOServer(asyncio.Protocol):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.transport = None
-        self.fut = None
+        self.outbox = None  # type: Optional[Outbox]
+        self.framed = False
+        self.scanner = LineScanner(max_line_length=1024)
 
     def connection_made(self, transport: asyncio.transports.Transport):
         peername = transport.get_extra_info('peername')
         print('TCP connection from {}'.format(peername))
         self.transport = transport
-        self.setup_callback()
-
-    def setup_callback(self):
-        self.fut = asyncio.ensure_future(tcp_queue.get())
-        self.fut.add_done_callback(self.handle_response)
+        self.outbox = Outbox(transport)
+        broker.attach(self.outbox)
 
     def connection_lost(self, exc):
         peername = self.transport.get_extra_info('peername')
-        self.fut.cancel()
+        broker.detach(self.outbox)
         print('connection lost:{}'.format(peername))
 
+    def pause_writing(self):
+        self.outbox.pause()
+
+    def resume_writing(self):
+        self.outbox.resume()
+
     def data_received(self, data):
+        if self.framed or data.startswith(b'@'):
+            self.handle_framed_data(data)
+            return
         try:
             message = data.decode().strip("\r\n")
             self.handle_remote_request(message)
         except Exception:
             pass
 
+    def handle_framed_data(self, data: bytes):
+        # '@<request id> <request>\n', each reply is sent back as '@<request id> <result>\n'
+        self.framed = True
+        for line in self.scanner.feed(data):
+            message = line.decode().strip("\r")
+            if not message.startswith('@'):
+                self.handle_remote_request(message)
+                continue
+            request_id, _, request = message[1:].partition(" ")
+            fut = asyncio.ensure_future(self.resolve_request(request))
+            fut.add_done_callback(partial(self.send_reply, request_id))
+
     def handle_remote_request(self, message: str):
-        # TODO client needs to send a request ID so response can be matched
+        if 'break' in message:
+            print('breakpoint')
+            return
         if message.startswith('can:'):
-            command = message.split('can:')[-1]
-            print('processing command: {!r}'.format(command))
-            asyncio.ensure_future(cmd_queue.put(command))
+            print('processing command: {!r}'.format(message[len('can:'):]))
+        fut = asyncio.ensure_future(self.resolve_request(message))
+        fut.add_done_callback(self.send_unframed_reply)
+
+    async def resolve_request(self, message: str) -> Optional[str]:
+        if message.startswith('can:'):
+            return await can_request(message[len('can:'):])
         elif message.startswith('robot:'):
-            message = message.strip('robot:')
-            asyncio.ensure_future(robot_api.run(message))
-        elif 'break' in message:
-            print('breakpoint')
+            return await robot_api.call(message[len('robot:'):])
+        elif message.startswith('sub:'):
+            self.outbox.subscriptions.update(message[len('sub:'):].split())
+            return " ".join(sorted(self.outbox.subscriptions))
+        elif message.startswith('unsub:'):
+            self.outbox.subscriptions.difference_update(message[len('unsub:'):].split())
+            return " ".join(sorted(self.outbox.subscriptions))
+        raise ValueError('unhandled request: {!r}'.format(message))
+
+    def send_reply(self, request_id: str, fut: Future):
+        if fut.cancelled():
+            result = "error cancelled"
+        elif fut.exception() is not None:
+            exc = fut.exception()
+            result = "error {} {}".format(exc.__class__.__name__, exc).rstrip()
         else:
-            print('unhandled request: {!r}'.format(message))
+            result = fut.result()
+            result = "ok" if result is None else result
+        self.outbox.reply("@{} {}\n".format(request_id, result).encode())
 
-    def handle_response(self, fut: Future):
-        peername = self.transport.get_extra_info('peername')
-        print('sending to:{}'.format(peername))
+    def send_unframed_reply(self, fut: Future):
         if fut.cancelled():
             return
-        response = fut.result()
-        self.transport.write(response.encode())
-        self.setup_callback()
+        if fut.exception() is not None:
+            print('request exception occured', "".join(traceback.format_exception(fut.exception())))
+            return
+        result = fut.result()
+        if result is not None and result != "ok":
+            self.outbox.reply(result.encode() + b"\n")
+
+
+def clear_rts(transport: serial_asyncio.SerialTransport):
+    try:
+        transport.serial.rts = False
+    except OSError:
+        pass  # a pty, e.g. the simulator's, has no modem control lines
 
 
 class EncoderUartServer(asyncio.Protocol):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.transport = None
-        self.buffer = []
+        self.scanner = LineScanner()
+        self.joints = {joint.verbose_name.encode(): joint for joint in robotic_arm.joints}
+        self.invalid_lines = 0
 
     def connection_made(self, transport: serial_asyncio.SerialTransport):
         self.transport = transport
         print('EncoderUartServer serial port opened')
-        self.transport.serial.rts = False
+        clear_rts(transport)
 
     def connection_lost(self, exc: Optional[Exception]):
         print('port closed')
         self.transport.loop.stop()
 
     def data_received(self, data: bytes):
-        self.buffer.append(data.decode())
-        contents = "".join(self.buffer)
-        if contents.count('\n') > 1:
-            self.buffer = []
-            # raise UartServerException("command not processed in time")
-        elif '\n' in contents:
-            to_process, rest = contents.split("\n")
-            self.buffer = [rest] if rest != "" else []
-            name, motor_angle, output_angle = self.parse_message(to_process)
-            if name is None:
-                return
-            self.buffer = []
-            joint = robotic_arm.joint(name)
-            joint.motor_angle = motor_angle
-            joint.output_angle = output_angle
+        for line in self.scanner.feed(data):
+            self.process_line(line)
+
+    def process_line(self, line: bytes):
+        name, motor_angle, output_angle = self.parse_message(line)
+        joint = self.joints.get(name)
+        if joint is None:
+            if line.strip():
+                self.invalid_lines += 1
+            return
+        joint.motor_angle = motor_angle
+        joint.output_angle = output_angle
+        if recorder is not None:
+            recorder.record_encoder(name, motor_angle, output_angle)
+        encoder_readings.notify(joint.slot)
 
     @staticmethod
-    def parse_message(msg) -> Union[Tuple[str, int, int], Tuple[None, None, None]]:
+    def parse_message(msg: bytes) -> Union[Tuple[bytes, int, int], Tuple[None, None, None]]:
         try:
-            name, angles = msg.strip().split(":")
-            motor_angle, output_angle = angles.split("/")
+            name, angles = msg.strip().split(b":")
+            motor_angle, output_angle = angles.split(b"/")
             return name, int(motor_angle), int(output_angle)
         except Exception:
             return None, None, None
@@ -303,15 +518,16 @@ class CANUartServer(asyncio.Protocol):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.transport = None
-        self.buffer = []
+        self.scanner = SLCANFrameScanner()
+        self.decode_errors = 0
         self.interface = ODriveCANInterface()
         self.skip_print = [enums.MSG_ODRIVE_HEARTBEAT, enums.MSG_GET_ENCODER_COUNT]
 
     def connection_made(self, transport: serial_asyncio.SerialTransport):
         self.transport = transport
         print('CANUartServer serial port opened')
-        self.transport.serial.rts = False
-        fut = asyncio.ensure_future(cmd_queue.get())
+        clear_rts(transport)
+        fut = asyncio.ensure_future(cmd_scheduler.get())
         fut.add_done_callback(self.process_user_input)
 
     def connection_lost(self, exc: Optional[Exception]):
@@ -319,56 +535,101 @@ class CANUartServer(asyncio.Protocol):
         self.transport.loop.stop()
 
     def data_received(self, data: bytes):
-        self.buffer.append(data.decode())
-        contents = "".join(self.buffer)
-        if contents.count('\r') > 1:
-            self.buffer = []
-            # raise UartServerException("command not processed in time")
-        elif '\r' in contents:
-            try:
-                to_process, rest = contents.split("\r")
-                self.buffer = [rest] if rest != "" else []
-                node_id, cmd_id, values = self.interface.process_response(to_process)
-                asyncio.ensure_future(rsp_queue.put(CANResponse(node_id, cmd_id, values)))
-                if cmd_id not in self.skip_print:
-                    asyncio.ensure_future(tcp_queue.put(str(values) + "\n"))
-                    print("CANUartServer raw:", to_process)
-                    print("parsed: node={}, cmd_id={}, values=".format(node_id, cmd_id), values)
-            except Exception as e:
-                print('CANUartServer data_received exception', data.decode(), e)
-                self.buffer = []
+        for frame in self.scanner.feed(data):
+            if frame[0] == DATA_FRAME:
+                self.process_frame(frame)
+
+    def process_frame(self, frame: bytes):
+        try:
+            can_id, payload = self.interface.decoder(frame)
+            if recorder is not None:
+                recorder.record_rx(can_id, payload)
+            node_id, cmd_id, values = self.interface.process_payload(can_id, payload)
+        except Exception as e:
+            self.decode_errors += 1
+            print('CANUartServer data_received exception', frame, e)
+            return
+        dispatcher.dispatch(node_id, cmd_id, values)
+        if log_frames and cmd_id not in self.skip_print:
+            print("CANUartServer raw:", frame.decode())
+            print("parsed: node={}, cmd_id={}, values=".format(node_id, cmd_id), values)
 
     def process_user_input(self, fut):
+        if fut.cancelled():
+            return
+        item = fut.result()
+        commands = item if isinstance(item, tuple) else (item,)
+        frames = [self.encode_command(command_raw.strip('\n')) for command_raw in commands]
+        # batched commands (e.g. a whole pose) share one write so every axis starts together
+        data = b"".join(frame for frame in frames if frame is not None)
+        if data:
+            self.transport.write(data)
+            if watchdog.awaiting_write:
+                watchdog.frames_written()
+        fut = asyncio.ensure_future(cmd_scheduler.get())
+        fut.add_done_callback(self.process_user_input)
+
+    def encode_command(self, command_raw: str) -> Optional[bytes]:
         skip_print = ['heartbeat', 'encoder']
-        command_raw = fut.result().strip('\n')
         tokens = command_raw.split(' ')
-        if tokens[-1] not in skip_print:
+        if log_frames and tokens[-1] not in skip_print:
             print('Received: {!r}'.format(command_raw))
         try:
-            packet_ascii = self.interface.process_command(tokens)
-            if tokens[-1] not in skip_print:
-                print('Sending: {!r}'.format(packet_ascii))
-            self.transport.write(packet_ascii.encode())
+            node_id, cmd = self.interface.resolve_command(tokens)
+            payload = None if cmd.is_remote else cmd.pack(tokens[2:])
+            frame = cmd.frame(node_id, payload)
         except Exception:
-            print("INVALID")
-        fut = asyncio.ensure_future(cmd_queue.get())
-        fut.add_done_callback(self.process_user_input)
+            print("INVALID", repr(command_raw))
+            return None
+        if recorder is not None:
+            recorder.record_tx(cmd.can_ids[node_id], payload, cmd.is_remote)
+        if log_frames and tokens[-1] not in skip_print:
+            print('Sending: {!r}'.format(frame.decode()))
+        if tokens[1] in ('setpos', 'setpos_ff'):
+            poller.notify_motion(int(tokens[0]))
+        else:
+            latency.written(int(tokens[0]), tokens[1])
+        return frame
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--log-frames', action='store_true', help='print every command and reply')
+    parser.add_argument('--can-port', default='/dev/tty232-0', help='serial port of the SLCAN adapter')
+    parser.add_argument('--encoder-port', default='/dev/ttyJ1', help='serial port of the output encoders')
+    parser.add_argument('--replay', help='telemetry recording to feed instead of the serial ports')
+    parser.add_argument('--speed', type=float, default=1.0, help='replay speed factor, 0 for as fast as possible')
+    parser.add_argument('--capture', help='write the frames sent during a replay to this file')
+    args = parser.parse_args()
+    log_frames = args.log_frames
     loop = asyncio.get_event_loop()
-    loop.add_reader(sys.stdin, process_stdin_data, cmd_queue)
-    coroutine0 = serial_asyncio.create_serial_connection(loop, CANUartServer, '/dev/tty232-0', 115200)
-    loop.run_until_complete(coroutine0)
-    coroutine1 = serial_asyncio.create_serial_connection(loop, EncoderUartServer, '/dev/ttyJ1', 115200)
-    loop.run_until_complete(coroutine1)
+    loop.add_reader(sys.stdin, process_stdin_data, cmd_scheduler)
+    replay = None
+    if args.replay:
+        replay = ReplaySession.from_path(args.replay, args.speed)
+        can_server = replay.connect(CANUartServer(), EncoderUartServer())
+    else:
+        recorder = TelemetryRecorder(RECORDING_DIR)
+        coroutine0 = serial_asyncio.create_serial_connection(loop, CANUartServer, args.can_port, CAN_BAUDRATE)
+        _, can_server = loop.run_until_complete(coroutine0)
+        coroutine1 = serial_asyncio.create_serial_connection(loop, EncoderUartServer, args.encoder_port, ENCODER_BAUDRATE)
+        loop.run_until_complete(coroutine1)
     coroutine2 = loop.create_server(IOServer, '127.0.0.1', 1978)
     server = loop.run_until_complete(coroutine2)
-    coroutine3 = loop.create_task(periodic_polling())
-    coroutine4 = loop.create_task(process_response())
-    loop.run_until_complete(asyncio.gather(coroutine3, coroutine4))
     try:
-        loop.run_forever()
+        if replay is not None:
+            # no poller or watchdog: their output depends on wall clock time, not on the capture
+            print('replay', loop.run_until_complete(replay.run()))
+            diff = replay.diff()
+            print('\n'.join(diff) if diff else 'outbound frames match the recording')
+            if args.capture:
+                with open(args.capture, 'wb') as outfile:
+                    outfile.writelines(replay.captured_frames())
+        else:
+            loop.create_task(watchdog.run())
+            coroutine3 = loop.create_task(poller.run())
+            loop.run_until_complete(coroutine3)
+            loop.run_forever()
     except KeyboardInterrupt:
         pass
 
@@ -376,3 +637,5 @@ if __name__ == '__main__':
     server.close()
     loop.run_until_complete(server.wait_closed())
     loop.close()
+    if recorder is not None:
+        recorder.close()
@@ -0,0 +1,84 @@
+import asyncio
+import time
+from collections import defaultdict, deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+from ODriveCANSimple.can_interface import COMMANDS_BY_NAME
+from ODriveCANSimple.exceptions import ODriveCANTimeout, ODriveCANUnsupportedCommand
+
+DEFAULT_TIMEOUT = 0.25
+DEFAULT_RETRIES = 2
+
+
+class PendingRequest:
+    __slots__ = ('future', 'command', 'sent_at')
+
+    def __init__(self, future: asyncio.Future, command: str, sent_at: float):
+        self.future = future
+        self.command = command
+        self.sent_at = sent_at
+
+
+class ResponseCorrelator:
+    """Matches CAN replies to outstanding requests by (node_id, response cmd_id), oldest first."""
+
+    def __init__(self, scheduler, timeout=DEFAULT_TIMEOUT, retries=DEFAULT_RETRIES):
+        self.scheduler = scheduler
+        self.timeout = timeout
+        self.retries = retries
+        self.pending = defaultdict(deque)  # type: Dict[Tuple[int, int], Deque[PendingRequest]]
+        self.completed = 0
+        self.resent = 0
+        self.timeouts = 0
+        self.last_round_trip = None  # type: Optional[float]
+        self.max_round_trip = 0.0
+
+    async def request(self, node_id: int, cmd_name: str, *params, timeout=None, retries=None) -> Optional[List[any]]:
+        cmd = COMMANDS_BY_NAME.get(cmd_name)
+        if cmd is None:
+            raise ODriveCANUnsupportedCommand(cmd_name)
+        command = " ".join([str(node_id), cmd_name, *map(str, params)])
+        if not cmd.is_remote:
+            await self.scheduler.put(command)
+            return None
+        timeout = self.timeout if timeout is None else timeout
+        retries = self.retries if retries is None else retries
+        key = (node_id, cmd.response_code)
+        loop = asyncio.get_event_loop()
+        for attempt in range(retries + 1):
+            if attempt:
+                self.resent += 1
+            entry = PendingRequest(loop.create_future(), command, time.monotonic())
+            self.pending[key].append(entry)
+            try:
+                await self.scheduler.put(command)
+                return await asyncio.wait_for(entry.future, timeout)
+            except asyncio.TimeoutError:
+                continue
+            finally:
+                if not entry.future.done():
+                    entry.future.cancel()
+                queued = self.pending[key]
+                if entry in queued:
+                    queued.remove(entry)
+        self.timeouts += 1
+        raise ODriveCANTimeout("no reply to {!r} after {} attempts".format(command, retries + 1))
+
+    def resolve(self, node_id: int, cmd_id: int, values: List[any]) -> bool:
+        queued = self.pending.get((node_id, cmd_id))
+        while queued:
+            entry = queued.popleft()
+            if entry.future.done():
+                continue
+            entry.future.set_result(values)
+            round_trip = time.monotonic() - entry.sent_at
+            self.last_round_trip = round_trip
+            self.max_round_trip = max(self.max_round_trip, round_trip)
+            self.completed += 1
+            return True
+        return False
+
+    def stats(self):
+        return dict(pending=sum(len(queued) for queued in self.pending.values()), completed=self.completed,
+                    resent=self.resent, timeouts=self.timeouts,
+                    last_round_trip=self.last_round_trip, max_round_trip=self.max_round_trip)
@@ -0,0 +1,57 @@
+from typing import Callable, Dict, List, Tuple
+
+from ODriveCANSimple.robot import RoboticArm, Joint
+
+Handler = Callable[[Joint, List[any]], None]
+Listener = Callable[[int, int, List[any]], any]
+
+
+class ResponseDispatcher:
+    """Applies decoded CAN replies straight from the serial parser.
+
+    Handlers are registered per cmd_id and called with the Joint that owns the node, listeners
+    see every reply from a known node.
+    """
+
+    def __init__(self, arm: RoboticArm):
+        self.joints = dict(arm.joints_by_node)  # type: Dict[int, Joint]
+        self.table = dict()  # type: Dict[int, Tuple[Handler, ...]]
+        self.listeners = ()  # type: Tuple[Listener, ...]
+        self.dispatched = 0
+        self.unknown_nodes = 0
+        self.handler_errors = 0
+
+    def register(self, cmd_id: int, handler: Handler):
+        self.table[cmd_id] = self.table.get(cmd_id, ()) + (handler,)
+        return handler
+
+    def handler(self, cmd_id: int):
+        def decorator(func: Handler):
+            return self.register(cmd_id, func)
+        return decorator
+
+    def add_listener(self, listener: Listener):
+        self.listeners += (listener,)
+
+    def dispatch(self, node_id: int, cmd_id: int, values: List[any]):
+        joint = self.joints.get(node_id)
+        if joint is None:
+            self.unknown_nodes += 1
+            return
+        # a failing handler must not cost the other handlers, or the rest of the serial chunk, the reply
+        for handler in self.table.get(cmd_id, ()):
+            try:
+                handler(joint, values)
+            except Exception as e:
+                self.handler_failed(handler, node_id, cmd_id, e)
+        for listener in self.listeners:
+            try:
+                listener(node_id, cmd_id, values)
+            except Exception as e:
+                self.handler_failed(listener, node_id, cmd_id, e)
+        self.dispatched += 1
+
+    def handler_failed(self, handler, node_id: int, cmd_id: int, exc: Exception):
+        self.handler_errors += 1
+        print('ResponseDispatcher {} failed on node={} cmd_id={}: {!r}'.format(
+            getattr(handler, '__qualname__', handler), node_id, cmd_id, exc))
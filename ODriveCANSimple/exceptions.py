@@ -13,3 +13,12 @@ class ODriveCANSignatureMismatch(Exception):
 
 class UartServerException(Exception):
     pass
+
+class ODriveCANTimeout(Exception):
+    pass
+
+class ODriveCANAxisError(Exception):
+    def __init__(self, node_id, error):
+        super().__init__("node {} axis error {}".format(node_id, error))
+        self.node_id = node_id
+        self.error = error
@@ -0,0 +1,122 @@
+from typing import List, Union
+
+FRAME_END = 0x0d  # '\r'
+DATA_FRAME = 0x74  # 't'
+REMOTE_FRAME = 0x54  # 'T'
+ACK_BYTES = (FRAME_END, 0x7a, 0x5a)  # '\r', 'z', 'Z' sent back by the adapter after a transmit
+BELL = 0x07  # adapter error reply
+HEADER_LENGTH = 5  # frame type + 3 digit CAN ID + DLC
+MAX_FRAME_LENGTH = HEADER_LENGTH + 16 + 1
+
+Buffer = Union[bytes, bytearray]
+
+
+class SLCANFrameScanner:
+    def __init__(self, max_frame_length=MAX_FRAME_LENGTH):
+        self.max_frame_length = max_frame_length
+        self.tail = bytearray()
+        self.frames = 0
+        self.dropped = 0
+        self.resyncs = 0
+        self.errors = 0
+
+    def feed(self, data: bytes) -> List[bytes]:
+        if self.tail:
+            self.tail += data
+            frames, consumed = self.scan(self.tail)
+            del self.tail[:consumed]
+        else:
+            frames, consumed = self.scan(data)
+            if consumed < len(data):
+                self.tail += memoryview(data)[consumed:]
+        return frames
+
+    def scan(self, buf: Buffer):
+        frames = []
+        pos = 0
+        size = len(buf)
+        while pos < size:
+            head = buf[pos]
+            if head != DATA_FRAME and head != REMOTE_FRAME:
+                if head in ACK_BYTES:
+                    pos += 1
+                    continue
+                if head == BELL:
+                    self.errors += 1
+                    pos += 1
+                    continue
+                self.resyncs += 1
+                pos = self.next_frame_start(buf, pos + 1, size)
+                continue
+            end = buf.find(b'\r', pos + HEADER_LENGTH, pos + self.max_frame_length)
+            if end == -1:
+                if size - pos < self.max_frame_length:
+                    break  # partial frame, wait for the rest
+                self.dropped += 1
+                self.resyncs += 1
+                pos = self.next_frame_start(buf, pos + 1, size)
+                continue
+            if not self.valid_length(buf, pos, end):
+                self.dropped += 1
+                self.resyncs += 1
+                pos = self.next_frame_start(buf, pos + 1, end + 1)
+                continue
+            frames.append(bytes(buf[pos:end]))
+            pos = end + 1
+        self.frames += len(frames)
+        return frames, pos
+
+    @staticmethod
+    def valid_length(buf: Buffer, start, end):
+        dlc = buf[start + 4] - 0x30
+        if buf[start] == REMOTE_FRAME:
+            return end - start == HEADER_LENGTH and 0 <= dlc <= 8
+        return 0 <= dlc <= 8 and end - start == HEADER_LENGTH + 2 * dlc
+
+    @staticmethod
+    def next_frame_start(buf: Buffer, start, end):
+        # hex digits never contain 't' or 'T', so either byte is a safe resync point
+        data_idx = buf.find(b't', start, end)
+        remote_idx = buf.find(b'T', start, end)
+        if data_idx == -1:
+            return end if remote_idx == -1 else remote_idx
+        if remote_idx == -1:
+            return data_idx
+        return min(data_idx, remote_idx)
+
+    def reset(self):
+        self.tail.clear()
+
+    def __repr__(self):
+        return "{}:frames={},dropped={},resyncs={},errors={}".format(
+            self.__class__.__name__, self.frames, self.dropped, self.resyncs, self.errors)
+
+
+class LineScanner:
+    def __init__(self, delimiter=b'\n', max_line_length=64):
+        self.delimiter = delimiter
+        self.max_line_length = max_line_length
+        self.tail = bytearray()
+        self.lines = 0
+        self.dropped = 0
+
+    def feed(self, data: bytes) -> List[bytes]:
+        if self.tail:
+            self.tail += data
+            lines = bytes(self.tail).split(self.delimiter)
+        else:
+            lines = data.split(self.delimiter)
+        rest = lines.pop()
+        if len(rest) > self.max_line_length:
+            # no delimiter in sight, whatever this is it can't be a reading
+            self.dropped += 1
+            rest = b''
+        self.tail[:] = rest
+        self.lines += len(lines)
+        return lines
+
+    def reset(self):
+        self.tail.clear()
+
+    def __repr__(self):
+        return "{}:lines={},dropped={}".format(self.__class__.__name__, self.lines, self.dropped)
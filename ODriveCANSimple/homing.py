@@ -0,0 +1,109 @@
+import asyncio
+import time
+from typing import Awaitable, Callable, Dict, List
+
+from ODriveCANSimple.robot import Joint
+
+COARSE_STEP = 20  # tenths of a degree at the output per fresh reading
+FINE_STEP = 2
+FINE_ZONE = 60  # switch to fine steps this close to joint_zero
+NO_ENCODER_STEP = 1000  # counts, joints without an output encoder only report a switch
+MAX_LEAD = 4  # steps the target may run ahead of the reported encoder count
+READING_TIMEOUT = 1.0
+HOMING_TIMEOUT = 120.0
+
+
+class EncoderReadings:
+    """Lets coroutines wait for the next output encoder reading of a joint."""
+
+    def __init__(self):
+        self.waiters = dict()  # type: Dict[int, List[asyncio.Future]]
+
+    def notify(self, slot: int):
+        waiters = self.waiters.pop(slot, None)
+        if not waiters:
+            return
+        for fut in waiters:
+            if not fut.done():
+                fut.set_result(None)
+
+    async def wait(self, slot: int, timeout=READING_TIMEOUT):
+        fut = asyncio.get_event_loop().create_future()
+        self.waiters.setdefault(slot, []).append(fut)
+        try:
+            await asyncio.wait_for(fut, timeout)
+        finally:
+            waiters = self.waiters.get(slot)
+            if waiters and fut in waiters:
+                waiters.remove(fut)
+
+
+class HomeJoint:
+    """Steps one joint towards joint_zero, one step per fresh output encoder reading.
+
+    Steps are coarse until the joint is within FINE_ZONE of zero and fine after that. Passing
+    zero in the coarse stage reverses into the fine stage once; passing it again fails.
+    """
+
+    def __init__(self, joint: Joint, readings: EncoderReadings, set_position: Callable[[int, int], Awaitable]):
+        self.joint = joint
+        self.readings = readings
+        self.set_position = set_position
+        self.duration = None
+        self.steps = 0
+        self.reason = None
+
+    async def __call__(self, timeout=HOMING_TIMEOUT) -> bool:
+        started = time.monotonic()
+        try:
+            homed = await asyncio.wait_for(self.run(), timeout)
+        except asyncio.TimeoutError:
+            homed, self.reason = False, self.reason or "timed out"
+        self.duration = time.monotonic() - started
+        return homed
+
+    async def run(self) -> bool:
+        try:
+            return await self.step_to_zero()
+        except asyncio.TimeoutError:
+            self.reason = "no encoder reading"
+            return False
+
+    async def step_to_zero(self) -> bool:
+        joint = self.joint
+        await self.readings.wait(joint.slot)
+        target = joint.shadow_count
+        if target is None:
+            self.reason = "no encoder count"
+            return False
+        direction = None if joint.no_encoder else joint.get_homing_direction()
+        fine = False
+        while True:
+            if joint.get_homing_state():
+                break
+            if joint.no_encoder:
+                step = NO_ENCODER_STEP
+            else:
+                if joint.get_homing_direction() != direction:
+                    if fine:
+                        self.reason = "past home"
+                        return False
+                    direction = joint.get_homing_direction()
+                    fine = True
+                fine = fine or abs(joint.current_joint_position) <= FINE_ZONE
+                step = direction * round((FINE_STEP if fine else COARSE_STEP) * abs(joint.multiplier))
+            if abs(target - joint.shadow_count) < MAX_LEAD * abs(step):
+                target += step
+                self.steps += 1
+                await self.set_position(joint.config.can_node_id, target)
+            await self.readings.wait(joint.slot)
+        joint.home_count = target
+        joint.homed = True
+        return True
+
+    def result(self, homed: bool) -> str:
+        status = "homed" if homed else "not homed ({})".format(self.reason)
+        return "{} {} {:.2f}s".format(self.joint.verbose_name, status, self.duration)
+
+    def __repr__(self):
+        return "{}:{}".format(self.__class__.__name__, self.joint.verbose_name)
@@ -0,0 +1,124 @@
+import math
+import time
+from collections import defaultdict, deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+from ODriveCANSimple.can_interface import COMMANDS_BY_CODE, COMMANDS_BY_NAME
+
+BUCKET_MIN = 10e-6  # upper bound of the first bucket, in seconds
+BUCKET_COUNT = 21  # doubling buckets, the last one ends at 10.49 s
+REPLY_TIMEOUT = 0.5  # written requests older than this when a reply arrives count as lost
+MAX_PENDING = 16
+
+
+class LogHistogram:
+    """Fixed power-of-two buckets from BUCKET_MIN up; anything above the last bucket lands in it."""
+
+    __slots__ = ('counts', 'total', 'max')
+
+    def __init__(self):
+        self.counts = [0] * BUCKET_COUNT
+        self.total = 0
+        self.max = 0.0
+
+    def record(self, seconds: float):
+        idx = 0 if seconds <= BUCKET_MIN else min(int(math.log2(seconds / BUCKET_MIN)) + 1, BUCKET_COUNT - 1)
+        self.counts[idx] += 1
+        self.total += 1
+        if seconds > self.max:
+            self.max = seconds
+
+    @staticmethod
+    def upper_bound(idx: int) -> float:
+        return BUCKET_MIN * 2 ** idx
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-th percentile."""
+        if not self.total:
+            return None
+        rank = q / 100.0 * self.total
+        seen = 0
+        for idx, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= rank:
+                return min(self.upper_bound(idx), self.max)
+        return self.max
+
+    def __repr__(self):
+        if not self.total:
+            return "n=0"
+        return "n={} p50={:.2f}ms p99={:.2f}ms max={:.2f}ms".format(
+            self.total, self.percentile(50) * 1000.0, self.percentile(99) * 1000.0, self.max * 1000.0)
+
+
+class RequestLatency:
+    __slots__ = ('queue', 'bus', 'total', 'lost')
+
+    def __init__(self):
+        self.queue = LogHistogram()  # enqueue -> serial write
+        self.bus = LogHistogram()  # serial write -> reply decoded
+        self.total = LogHistogram()
+        self.lost = 0
+
+
+class LatencyTracker:
+    """Per (node, command) latency of remote requests: queueing, bus delay and the end to end total.
+
+    Requests are stamped when they are queued and when they are written; each decoded reply
+    closes the oldest written request of its node and command.
+    """
+
+    def __init__(self):
+        self.tracked = {name for name, cmd in COMMANDS_BY_NAME.items() if cmd.is_remote}
+        self.pending = defaultdict(deque)  # type: Dict[Tuple[int, str], Deque[List[Optional[float]]]]
+        self.latencies = defaultdict(RequestLatency)  # type: Dict[Tuple[int, str], RequestLatency]
+        self.unmatched = 0
+
+    def enqueued(self, node_id: str, cmd_name: str):
+        if cmd_name not in self.tracked:
+            return
+        pending = self.pending[(int(node_id), cmd_name)]
+        if len(pending) >= MAX_PENDING:
+            pending.popleft()
+        pending.append([time.monotonic(), None])
+
+    def written(self, node_id: int, cmd_name: str, now=None):
+        if cmd_name not in self.tracked:
+            return
+        now = time.monotonic() if now is None else now
+        for entry in self.pending[(node_id, cmd_name)]:
+            if entry[1] is None:
+                entry[1] = now
+                return
+        # written without going through the scheduler, e.g. a raw can: request
+        self.pending[(node_id, cmd_name)].append([None, now])
+
+    def replied(self, node_id: int, cmd_id: int, values=None):
+        cmd = COMMANDS_BY_CODE.get(cmd_id)
+        if cmd is None or cmd.name not in self.tracked:
+            return
+        key = (node_id, cmd.name)
+        pending = self.pending.get(key)
+        now = time.monotonic()
+        latency = self.latencies[key]
+        while pending and pending[0][1] is not None and now - pending[0][1] > REPLY_TIMEOUT:
+            pending.popleft()
+            latency.lost += 1
+        if not pending or pending[0][1] is None:
+            # a reply nobody asked for (or to a request we stopped waiting for)
+            self.unmatched += 1
+            return
+        enqueued_at, written_at = pending.popleft()
+        latency.bus.record(now - written_at)
+        if enqueued_at is not None:
+            latency.queue.record(written_at - enqueued_at)
+            latency.total.record(now - enqueued_at)
+
+    def reset(self):
+        self.latencies.clear()
+        self.unmatched = 0
+
+    def report(self) -> List[str]:
+        return ["{} {} queue {} bus {} total {} lost={}".format(node_id, cmd_name, latency.queue, latency.bus,
+                                                                latency.total, latency.lost)
+                for (node_id, cmd_name), latency in sorted(self.latencies.items())]
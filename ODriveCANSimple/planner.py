@@ -0,0 +1,109 @@
+from collections import OrderedDict
+from typing import Dict, Tuple
+
+import numpy as np
+
+PLAN_CACHE_SIZE = 64
+
+Limits = Tuple[Tuple[float, ...], Tuple[float, ...], Tuple[Tuple[float, float], ...]]
+
+
+class MotionPlan:
+    """Synchronized trapezoidal velocity profiles for every joint, all finishing at `duration`.
+
+    Each joint keeps its own acceleration limit and cruises at the lowest velocity that still
+    covers its distance in the common duration, so the slowest joint sets the pace and no
+    joint exceeds its velocity limit.
+    """
+
+    def __init__(self, start: np.ndarray, goal: np.ndarray, max_velocity: np.ndarray, max_acceleration: np.ndarray):
+        self.start = start
+        self.goal = goal
+        distance = np.abs(goal - start)
+        self.direction = np.sign(goal - start)
+        self.acceleration = max_acceleration
+        # shortest time per joint: trapezoid if it reaches max velocity, triangle otherwise
+        reaches_max = distance >= max_velocity ** 2 / max_acceleration
+        fastest = np.where(reaches_max, distance / max_velocity + max_velocity / max_acceleration,
+                           2.0 * np.sqrt(distance / max_acceleration))
+        self.duration = float(fastest.max()) if len(fastest) else 0.0
+        # cruise velocity v that covers distance d in duration T: d = v * (T - v / a)
+        a_t = max_acceleration * self.duration
+        self.velocity = (a_t - np.sqrt(np.maximum(a_t ** 2 - 4.0 * max_acceleration * distance, 0.0))) / 2.0
+        self.accel_time = np.divide(self.velocity, max_acceleration,
+                                    out=np.zeros_like(self.velocity), where=max_acceleration > 0)
+        self.samples = dict()  # type: Dict[float, np.ndarray]
+
+    def positions(self, t: np.ndarray) -> np.ndarray:
+        """Joint angles at each time in `t`, one row per time."""
+        t = np.clip(np.asarray(t, dtype=float), 0.0, self.duration)[:, None]
+        a, v, ta, duration = self.acceleration, self.velocity, self.accel_time, self.duration
+        td = duration - ta
+        accel = 0.5 * a * t ** 2
+        cruise = 0.5 * a * ta ** 2 + v * (t - ta)
+        decel = v * (duration - ta) - 0.5 * a * (duration - t) ** 2
+        travelled = np.where(t < ta, accel, np.where(t < td, cruise, decel))
+        return self.start + self.direction * travelled
+
+    def sample(self, rate: float) -> np.ndarray:
+        # same tick layout as Trajectory.sample(), memoized since cached plans are replayed
+        setpoints = self.samples.get(rate)
+        if setpoints is None:
+            ticks = np.append(np.arange(0.0, self.duration, 1.0 / rate), self.duration)
+            setpoints = self.positions(ticks)
+            setpoints[-1] = self.goal
+            setpoints.flags.writeable = False
+            self.samples[rate] = setpoints
+        return setpoints
+
+    def __repr__(self):
+        return "{}:{:.3f}s".format(self.__class__.__name__, self.duration)
+
+
+class MotionPlanner:
+    """Plans moves in joint angles (tenths of a degree) with an LRU cache of recent plans."""
+
+    def __init__(self, joint_limits, max_velocity, max_acceleration, cache_size=PLAN_CACHE_SIZE):
+        self.joint_limits = np.asarray(joint_limits, dtype=float)
+        self.max_velocity = np.asarray(max_velocity, dtype=float)
+        self.max_acceleration = np.asarray(max_acceleration, dtype=float)
+        if np.any(self.max_velocity <= 0) or np.any(self.max_acceleration <= 0):
+            raise ValueError("velocity and acceleration limits must be positive")
+        self.limits = (tuple(self.max_velocity), tuple(self.max_acceleration),
+                       tuple(map(tuple, self.joint_limits)))  # type: Limits
+        self.cache_size = cache_size
+        self.cache = OrderedDict()  # type: OrderedDict[Tuple, MotionPlan]
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def for_arm(cls, arm, **kwargs) -> 'MotionPlanner':
+        configs = [joint.config for joint in arm.joints]
+        return cls([config.joint_limits for config in configs], [config.max_velocity for config in configs],
+                   [config.max_acceleration for config in configs], **kwargs)
+
+    def plan(self, start, goal) -> MotionPlan:
+        start = np.rint(np.asarray(start, dtype=float))
+        goal = np.rint(np.asarray(goal, dtype=float))
+        if start.shape != self.max_velocity.shape or goal.shape != self.max_velocity.shape:
+            raise ValueError("need one angle per joint")
+        if np.any(np.isnan(start)):
+            raise ValueError("start pose is unknown")
+        low, high = self.joint_limits.T
+        if np.any(goal < low) or np.any(goal > high):
+            raise ValueError("goal is outside joint limits")
+        key = (tuple(start), tuple(goal), self.limits)
+        plan = self.cache.get(key)
+        if plan is not None:
+            self.cache.move_to_end(key)
+            self.hits += 1
+            return plan
+        self.misses += 1
+        plan = MotionPlan(start, goal, self.max_velocity, self.max_acceleration)
+        self.cache[key] = plan
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return plan
+
+    def stats(self):
+        return dict(cached=len(self.cache), hits=self.hits, misses=self.misses)
@@ -0,0 +1,193 @@
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from ODriveCANSimple.robot import RoboticArm
+
+UART_BITS_PER_CHAR = 10  # start + 8 data + stop
+RESPONSE_FRAME_CHARS = 22  # 't' + CAN ID + DLC + 16 hex digits + '\r'
+ENCODER_MOTION_THRESHOLD = 8  # counts between two encoder replies
+RATE_SMOOTHING = 0.2
+FRAME_BURST = 4  # frames the token bucket may bank to absorb timer overshoot
+
+
+@dataclass
+class PollRate:
+    moving: float
+    idle: float
+
+
+DEFAULT_RATES = {
+    'heartbeat': PollRate(moving=10.0, idle=2.0),
+    'encoder': PollRate(moving=50.0, idle=2.0),
+}
+
+
+def link_frame_rate(baudrate):
+    # full frames per second the serial link carries
+    return baudrate / UART_BITS_PER_CHAR / RESPONSE_FRAME_CHARS
+
+
+def frame_budget(baudrate, utilization=0.5):
+    return link_frame_rate(baudrate) * utilization
+
+
+class RateMeter:
+    def __init__(self):
+        self.count = 0
+        self.last = None
+        self.interval = None
+
+    def tick(self, now):
+        self.count += 1
+        if self.last is not None:
+            interval = now - self.last
+            if self.interval is None:
+                self.interval = interval
+            else:
+                self.interval += RATE_SMOOTHING * (interval - self.interval)
+        self.last = now
+
+    @property
+    def rate(self):
+        return self.rate_at(time.monotonic())
+
+    def rate_at(self, now):
+        if not self.interval:
+            return 0.0
+        # once the next tick is overdue the silence itself bounds the rate, so a node that
+        # stopped answering decays toward zero instead of showing its last smoothed rate
+        return 1.0 / max(self.interval, now - self.last)
+
+
+class PollTarget:
+    def __init__(self, node_id: int, joint_name: str, cmd_name: str, rate: PollRate):
+        self.node_id = node_id
+        self.joint_name = joint_name
+        self.cmd_name = cmd_name
+        self.command = "{} {}".format(node_id, cmd_name)
+        self.rate = rate
+        self.target_rate = rate.idle
+        self.deadline = 0.0
+        self.issued = RateMeter()
+        self.replies = RateMeter()
+        self.skipped = 0
+
+    def __repr__(self):
+        return "{} {} target={:.1f} issued={:.1f} replies={:.1f} skipped={}".format(
+            self.joint_name, self.cmd_name, self.target_rate, self.issued.rate, self.replies.rate, self.skipped)
+
+
+class AdaptivePoller:
+    """Polls every node on monotonic deadlines.
+
+    Each (node, command) runs at its moving rate for `motion_hold` seconds after a setpoint is
+    sent or the encoder count changes, and at its idle rate otherwise. When the total exceeds
+    the frame budget of the serial link every rate is scaled down by the same factor.
+
+    Polls draw from a token bucket refilled at the full link rate; setpoint frames are charged
+    to the same bucket with charge(), so polling yields the link to streamed motion.
+    """
+
+    def __init__(self, arm: RoboticArm, scheduler, baudrate=115200, utilization=0.5,
+                 rates: Optional[Dict[str, PollRate]] = None, motion_hold=1.0):
+        self.scheduler = scheduler
+        self.budget = frame_budget(baudrate, utilization)
+        self.link_rate = link_frame_rate(baudrate)
+        self.motion_hold = motion_hold
+        rates = DEFAULT_RATES if rates is None else rates
+        self.targets = [PollTarget(joint.config.can_node_id, joint.verbose_name, cmd_name, rate)
+                        for joint in arm.joints for cmd_name, rate in rates.items()]  # type: List[PollTarget]
+        self.by_key = {(target.node_id, target.cmd_name): target for target in self.targets}
+        self.last_motion = {joint.config.can_node_id: None for joint in arm.joints}
+        self.last_count = dict()
+        self.tokens = 1.0
+        self.last_refill = None
+
+    def notify_motion(self, node_id: int, now=None):
+        now = time.monotonic() if now is None else now
+        was_moving = self.is_moving(node_id, now)
+        self.last_motion[node_id] = now
+        if was_moving:
+            return
+        for target in self.targets:
+            if target.node_id == node_id:
+                # don't leave a joint that just started moving on its idle deadline
+                target.deadline = min(target.deadline, now + 1.0 / target.rate.moving)
+
+    def record_reply(self, node_id: int, cmd_name: str, *values):
+        now = time.monotonic()
+        target = self.by_key.get((node_id, cmd_name))
+        if target is not None:
+            target.replies.tick(now)
+        if cmd_name == 'encoder':
+            shadow_count = values[0]
+            previous = self.last_count.get(node_id)
+            self.last_count[node_id] = shadow_count
+            if previous is not None and abs(shadow_count - previous) > ENCODER_MOTION_THRESHOLD:
+                self.notify_motion(node_id, now)
+
+    def reply_handler(self, cmd_name: str):
+        def handler(joint, values):
+            self.record_reply(joint.config.can_node_id, cmd_name, *values)
+        return handler
+
+    def is_moving(self, node_id: int, now):
+        last_motion = self.last_motion.get(node_id)
+        return last_motion is not None and now - last_motion < self.motion_hold
+
+    def update_target_rates(self, now):
+        for target in self.targets:
+            target.target_rate = target.rate.moving if self.is_moving(target.node_id, now) else target.rate.idle
+        demand = sum(target.target_rate for target in self.targets)
+        if demand > self.budget:
+            scale = self.budget / demand
+            for target in self.targets:
+                target.target_rate *= scale
+
+    def refill(self, now):
+        if self.last_refill is not None:
+            self.tokens = min(FRAME_BURST, self.tokens + (now - self.last_refill) * self.link_rate)
+        self.last_refill = now
+
+    def charge(self, frames: int, now=None):
+        """Accounts for frames sent outside the poller, the debt is capped at a second of link time."""
+        self.refill(time.monotonic() if now is None else now)
+        self.tokens = max(self.tokens - frames, -self.link_rate)
+
+    async def acquire_frame(self):
+        # token bucket at the link rate, the poll targets themselves are scaled to the budget
+        while True:
+            self.refill(time.monotonic())
+            if self.tokens >= 1.0:
+                self.tokens -= 1.0
+                return
+            await asyncio.sleep((1.0 - self.tokens) / self.link_rate)
+
+    async def run(self, startup_delay=1.0):
+        await asyncio.sleep(startup_delay)
+        start = time.monotonic()
+        for target in self.targets:
+            target.deadline = start
+        while True:
+            target = min(self.targets, key=lambda t: t.deadline)
+            delay = target.deadline - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue  # a motion notification may have moved another deadline up
+            await self.acquire_frame()
+            now = time.monotonic()
+            try:
+                self.scheduler.put_nowait(target.command)
+                target.issued.tick(now)
+            except asyncio.QueueFull:
+                target.skipped += 1
+            self.update_target_rates(now)
+            period = 1.0 / target.target_rate
+            # stay on the deadline grid, skipping slots that have already been missed
+            missed = int((now - target.deadline) // period)
+            target.deadline += period * (missed + 1)
+
+    def report(self) -> List[str]:
+        return [str(target) for target in self.targets]
@@ -0,0 +1,100 @@
+from collections import OrderedDict, deque
+from typing import Iterable, Optional, Set
+
+TOPICS = ('heartbeat', 'encoder', 'offset', 'errors')
+DEFAULT_SUBSCRIPTIONS = ()  # opt-in with 'sub:', a client that never subscribes only ever gets replies
+
+
+class Outbox:
+    """Bounded per-connection send buffer.
+
+    Replies are always kept. Published messages are keyed by (topic, joint) so a
+    consumer that can't keep up only ever holds the latest value of each, and the
+    oldest ones are dropped once the outbox is full.
+    """
+
+    def __init__(self, transport, maxsize=64, max_replies=1024, subscriptions: Iterable[str] = DEFAULT_SUBSCRIPTIONS):
+        self.transport = transport
+        self.maxsize = maxsize
+        self.max_replies = max_replies
+        self.subscriptions = set(subscriptions)  # type: Set[str]
+        self.replies = deque()
+        self.published = OrderedDict()
+        self.paused = False
+        self.sent = 0
+        self.coalesced = 0
+        self.dropped = 0
+
+    def wants(self, topic: str, joint_name: str, joint_topic: str):
+        subscriptions = self.subscriptions
+        return topic in subscriptions or joint_name in subscriptions or joint_topic in subscriptions
+
+    def reply(self, data: bytes):
+        if not self.paused and not self.replies and not self.published:
+            self.write(data)
+            return
+        if len(self.replies) >= self.max_replies:
+            print('outbox: consumer is not reading replies, closing')
+            self.transport.close()
+            return
+        self.replies.append(data)
+
+    def publish(self, key, data: bytes):
+        if not self.paused and not self.replies and not self.published:
+            self.write(data)
+            return
+        if key in self.published:
+            self.published[key] = data
+            self.coalesced += 1
+            return
+        if len(self.published) >= self.maxsize:
+            self.published.popitem(last=False)
+            self.dropped += 1
+        self.published[key] = data
+
+    def write(self, data: bytes):
+        if self.transport.is_closing():
+            return
+        self.transport.write(data)
+        self.sent += 1
+
+    def pause(self):
+        self.paused = True
+
+    def resume(self):
+        self.paused = False
+        self.flush()
+
+    def flush(self):
+        while self.replies and not self.paused:
+            self.write(self.replies.popleft())
+        while self.published and not self.paused:
+            _, data = self.published.popitem(last=False)
+            self.write(data)
+
+    def __repr__(self):
+        return "{}:sent={},coalesced={},dropped={},subscriptions={}".format(
+            self.__class__.__name__, self.sent, self.coalesced, self.dropped, sorted(self.subscriptions))
+
+
+class Broker:
+    def __init__(self):
+        self.outboxes = set()  # type: Set[Outbox]
+
+    def attach(self, outbox: Outbox):
+        self.outboxes.add(outbox)
+
+    def detach(self, outbox: Outbox):
+        self.outboxes.discard(outbox)
+
+    def publish(self, topic: str, joint_name: str, *values):
+        if not self.outboxes:
+            return
+        joint_topic = "{}/{}".format(topic, joint_name)
+        data = None  # type: Optional[bytes]
+        for outbox in self.outboxes:
+            if not outbox.wants(topic, joint_name, joint_topic):
+                continue
+            if data is None:
+                data = " ".join([topic, joint_name, *map(str, values)]).encode() + b"\n"
+            outbox.publish((topic, joint_name), data)
@@ -0,0 +1,113 @@
+import glob
+import mmap
+import os
+import struct
+import time
+from typing import List, Optional
+
+import numpy as np
+
+KIND_EMPTY = 0  # never written, the tail of the current file
+KIND_HEADER = 1  # first record of every file, payload holds the wall clock in ns
+KIND_RX = 2
+KIND_TX = 3
+KIND_ENCODER = 4
+
+RECORD_DTYPE = np.dtype([
+    ('t_ns', '<u8'),  # time.monotonic_ns()
+    ('kind', 'u1'),
+    ('remote', 'u1'),
+    ('can_id', '<u2'),
+    ('name', 'S4'),  # encoder records: joint name as sent over the UART
+    ('payload', 'V8'),
+    ('motor_angle', '<i4'),
+    ('output_angle', '<i4'),
+])
+RECORD = struct.Struct('<QBBH4s8sii')
+assert RECORD.size == RECORD_DTYPE.itemsize == 32
+
+RECORDS_PER_FILE = 1 << 20  # 32 MiB per file
+MAX_FILES = 16
+FILE_PATTERN = 'telemetry-*.bin'
+EMPTY_PAYLOAD = bytes(8)
+EMPTY_NAME = bytes(4)
+
+
+class TelemetryRecorder:
+    """Appends fixed-size binary records to a rotating set of memory-mapped files.
+
+    Each record is packed straight into the map, nothing is formatted. A full file is
+    closed and the next one started, and only the newest `max_files` are kept on disk.
+    """
+
+    def __init__(self, directory, records_per_file=RECORDS_PER_FILE, max_files=MAX_FILES):
+        self.directory = directory
+        self.file_size = records_per_file * RECORD.size
+        self.max_files = max_files
+        self.map = None  # type: Optional[mmap.mmap]
+        self.offset = 0
+        self.sequence = 0
+        self.written = 0
+        os.makedirs(directory, exist_ok=True)
+        self.rotate()
+
+    def rotate(self):
+        self.close()
+        self.sequence += 1
+        path = os.path.join(self.directory, 'telemetry-{}-{:04d}.bin'.format(
+            time.strftime('%Y%m%d-%H%M%S'), self.sequence))
+        with open(path, 'w+b') as outfile:
+            outfile.truncate(self.file_size)
+            self.map = mmap.mmap(outfile.fileno(), self.file_size)
+        self.offset = 0
+        self.write(KIND_HEADER, 0, 0, EMPTY_NAME, struct.pack('<Q', time.time_ns()), 0, 0)
+        for old in recording_files(self.directory)[:-self.max_files]:
+            os.remove(old)
+
+    def write(self, kind, remote, can_id, name, payload, motor_angle, output_angle):
+        if self.offset + RECORD.size > self.file_size:
+            self.rotate()
+        RECORD.pack_into(self.map, self.offset, time.monotonic_ns(), kind, remote, can_id, name, payload,
+                         motor_angle, output_angle)
+        self.offset += RECORD.size
+        self.written += 1
+
+    def record_rx(self, can_id: int, payload: bytes):
+        self.write(KIND_RX, 0, can_id, EMPTY_NAME, payload, 0, 0)
+
+    def record_tx(self, can_id: int, payload: Optional[bytes], remote: bool):
+        # the packed payload the frame was encoded from, None for a remote frame
+        self.write(KIND_TX, remote, can_id, EMPTY_NAME, EMPTY_PAYLOAD if payload is None else payload, 0, 0)
+
+    def record_encoder(self, name: bytes, motor_angle: int, output_angle: int):
+        self.write(KIND_ENCODER, 0, 0, name, EMPTY_PAYLOAD, motor_angle, output_angle)
+
+    def close(self):
+        if self.map is not None:
+            self.map.flush()
+            self.map.close()
+            self.map = None
+
+    def __repr__(self):
+        return "{}:{},written={}".format(self.__class__.__name__, self.directory, self.written)
+
+
+def recording_files(directory) -> List[str]:
+    return sorted(glob.glob(os.path.join(directory, FILE_PATTERN)))
+
+
+def load(path, kinds=(KIND_RX, KIND_TX, KIND_ENCODER)) -> np.ndarray:
+    """Reads a recording file, or every file in a directory in order, as one structured array."""
+    paths = recording_files(path) if os.path.isdir(path) else [path]
+    parts = []
+    for file_path in paths:
+        records = np.memmap(file_path, dtype=RECORD_DTYPE, mode='r')
+        parts.append(np.asarray(records[np.isin(records['kind'], kinds)]))
+    if not parts:
+        return np.empty(0, dtype=RECORD_DTYPE)
+    return np.concatenate(parts)
+
+
+def payload_words(records: np.ndarray, dtype='<i4') -> np.ndarray:
+    """The payloads reinterpreted as two words each, e.g. ('<i4') for counts or ('<u4') for errors."""
+    return np.ascontiguousarray(records['payload']).view(dtype).reshape(len(records), -1)
@@ -0,0 +1,130 @@
+import asyncio
+import difflib
+import time
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+import ODriveCANSimple.enums as enums
+from ODriveCANSimple.can_interface import encode_slcan
+from ODriveCANSimple.recorder import KIND_ENCODER, KIND_RX, KIND_TX, load
+
+# polls depend on timing rather than on the replayed traffic, they are left out of the diff
+POLL_CODES = (enums.MSG_GET_ODRIVE_HEARTBEAT, enums.MSG_GET_ENCODER_COUNT)
+YIELD_EVERY = 64  # records fed between yields to the loop when replaying as fast as possible
+
+
+class CaptureSerial:
+    rts = False
+
+
+class CaptureTransport(asyncio.Transport):
+    """Takes the place of a serial transport and keeps everything the server writes."""
+
+    def __init__(self, loop=None):
+        super().__init__()
+        self.loop = loop or asyncio.get_event_loop()
+        self.serial = CaptureSerial()
+        self.writes = []  # type: List[Tuple[int, bytes]]
+        self.closing = False
+
+    def write(self, data):
+        self.writes.append((time.monotonic_ns(), bytes(data)))
+
+    def frames(self) -> List[bytes]:
+        return [frame + b'\r' for _, data in self.writes for frame in data.split(b'\r') if frame]
+
+    def get_write_buffer_size(self):
+        return 0
+
+    def is_closing(self):
+        return self.closing
+
+    def close(self):
+        self.closing = True
+
+
+class ReplayStats:
+    def __init__(self, records: int, recorded_span: float, elapsed: float):
+        self.records = records
+        self.recorded_span = recorded_span
+        self.elapsed = elapsed
+
+    def __repr__(self):
+        rate = self.records / self.elapsed if self.elapsed else 0.0
+        return "records={} recorded={:.3f}s elapsed={:.3f}s rate={:.0f}/s".format(
+            self.records, self.recorded_span, self.elapsed, rate)
+
+
+class ReplaySession:
+    """Feeds recorded CAN replies and encoder lines to the server protocols.
+
+    With speed > 0 records are delivered on the recorded schedule scaled by `speed`, with
+    speed 0 as fast as the loop takes them. Outbound frames are captured for diffing against
+    the TX records of the same capture; requests that came in over TCP are not part of the
+    recording and have to be sent again for their frames to match.
+    """
+
+    def __init__(self, records: np.ndarray, speed=1.0):
+        self.records = records
+        self.speed = speed
+        self.can_protocol = None  # type: Optional[asyncio.Protocol]
+        self.encoder_protocol = None  # type: Optional[asyncio.Protocol]
+        self.can_transport = None  # type: Optional[CaptureTransport]
+        # encode everything up front so the replay loop only delivers bytes
+        inbound = records[np.isin(records['kind'], (KIND_RX, KIND_ENCODER))]
+        self.times = (inbound['t_ns'] - inbound['t_ns'][0]) / 1e9 if len(inbound) else np.zeros(0)
+        self.chunks = [(record['kind'] == KIND_RX, inbound_bytes(record)) for record in inbound]
+
+    @classmethod
+    def from_path(cls, path, speed=1.0) -> 'ReplaySession':
+        return cls(load(path), speed)
+
+    def connect(self, can_protocol: asyncio.Protocol, encoder_protocol: asyncio.Protocol):
+        self.can_protocol = can_protocol
+        self.encoder_protocol = encoder_protocol
+        self.can_transport = CaptureTransport()
+        can_protocol.connection_made(self.can_transport)
+        encoder_protocol.connection_made(CaptureTransport())
+        return can_protocol
+
+    async def run(self) -> ReplayStats:
+        can_received = self.can_protocol.data_received
+        encoder_received = self.encoder_protocol.data_received
+        start = time.monotonic()
+        for idx, (is_can, data) in enumerate(self.chunks):
+            if self.speed:
+                delay = start + self.times[idx] / self.speed - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            elif idx % YIELD_EVERY == 0:
+                await asyncio.sleep(0)
+            if is_can:
+                can_received(data)
+            else:
+                encoder_received(data)
+        await asyncio.sleep(0)  # let the last replies be handled
+        span = float(self.times[-1]) if len(self.times) else 0.0
+        return ReplayStats(len(self.chunks), span, time.monotonic() - start)
+
+    def recorded_frames(self) -> List[bytes]:
+        return [encode_slcan(int(record['can_id']), record['payload'].tobytes(), bool(record['remote']))
+                for record in self.records[self.records['kind'] == KIND_TX]]
+
+    def captured_frames(self) -> List[bytes]:
+        return self.can_transport.frames() if self.can_transport is not None else []
+
+    def diff(self, skip_codes: Sequence[int] = POLL_CODES) -> List[str]:
+        recorded = [frame.decode().strip() for frame in self.recorded_frames() if frame_code(frame) not in skip_codes]
+        captured = [frame.decode().strip() for frame in self.captured_frames() if frame_code(frame) not in skip_codes]
+        return list(difflib.unified_diff(recorded, captured, 'recorded', 'replayed', lineterm=''))
+
+
+def inbound_bytes(record) -> bytes:
+    if record['kind'] == KIND_RX:
+        return encode_slcan(int(record['can_id']), record['payload'].tobytes())
+    return b'%s:%d/%d\n' % (record['name'], record['motor_angle'], record['output_angle'])
+
+
+def frame_code(frame: bytes) -> int:
+    return int(frame[1:4], 16) & 0x1f
@@ -1,11 +1,14 @@
-from operator import attrgetter
 from typing import List
 import os
 import yaml
 from dataclasses import dataclass
 
+import numpy as np
 from dacite import from_dict
 
+from ODriveCANSimple.state_store import JointStateStore, SetpointActualView, StoredField
+from ODriveCANSimple.state_tracker import AxisStateTracker
+
 cur_dir = os.path.dirname(os.path.abspath(__file__))
 ANGLE_TOLERANCE = 10
 
@@ -28,6 +31,8 @@ class JointDef:
     cpr: int
     can_node_id: int
     has_output_encoder: int
+    max_velocity: float = 300.0  # tenths of a degree per second at the output
+    max_acceleration: float = 600.0
 
 
 @dataclass
@@ -44,33 +49,29 @@ def offset_angle(raw_angle, absolute_angle):
 
 class Joint:
     cf = 4096.0 / 3600.0
-
-    def __init__(self, joint_def: JointDef):
+    error = StoredField('error')
+    motor_angle = StoredField('motor_angle')
+    output_angle = StoredField('output_angle')
+    output_angle_initial = StoredField('output_angle_initial')
+    cpr_initial = StoredField('cpr_initial')
+    shadow_count_initial = StoredField('shadow_count_initial')
+    home_count = StoredField('home_count')
+    _cpr = StoredField('cpr')
+    _shadow_count = StoredField('shadow_count')
+
+    def __init__(self, joint_def: JointDef, store: JointStateStore = None, slot=0):
         self.joint_name = joint_def.name  # type: str
         self.joint_number = int(self.joint_name)
         self.config = joint_def
-        self.offset = SetpointActual(None, None)
-        self.requested_state = SetpointActual(None, None)
-        self.encoder_is_ready = SetpointActual(None, None)
-        self.error = None
-        self.motor_angle = None
-        self.output_angle_initial = None
-        self.output_angle = None
-        self._cpr = None
-        self.cpr_initial = None
-        self._shadow_count = None
-        self.shadow_count_initial = None
+        self.store = store if store is not None else JointStateStore(1, [self.verbose_name])
+        self.slot = slot
+        self.offset = SetpointActualView(self.store, slot, 'offset_setpoint', 'offset_actual')
+        self.requested_state = SetpointActualView(self.store, slot, 'requested_state', 'axis_state')
+        self.encoder_is_ready = SetpointActualView(self.store, slot, 'encoder_ready_setpoint', 'encoder_ready_actual')
         self.homed = False
-        self.home_count = None
 
     def reset_state(self):
-        self.offset = SetpointActual(None, None)
-        self.requested_state = SetpointActual(None, None)
-        self.encoder_is_ready = SetpointActual(None, None)
-        self._cpr = None
-        self.cpr_initial = None
-        self._shadow_count = None
-        self.shadow_count_initial = None
+        self.store.reset(self.slot)
 
     def calculate_offset(self, angle_override=None):
         abs_angle = self.config.absolute_angle if not angle_override else angle_override
@@ -161,32 +162,61 @@ class Joint:
 
 
 class RoboticArm:
-    def __init__(self):
-        self.joints = self.initialize_joints()
+    def __init__(self, skip=None):
+        joint_defs = self.load_joint_defs(skip)
+        self.store = JointStateStore(len(joint_defs), ['j' + joint_def.name for joint_def in joint_defs])
+        self.joints = tuple(Joint(joint_def, self.store, slot) for slot, joint_def in enumerate(joint_defs))
+        self.joints_by_name = {j.verbose_name: j for j in self.joints}
+        self.joints_by_node = {j.config.can_node_id: j for j in self.joints}
+        self.slots_by_node = {j.config.can_node_id: j.slot for j in self.joints}
+        self.node_ids = np.array([j.config.can_node_id for j in self.joints])
+        self.multipliers = np.array([j.multiplier for j in self.joints])
+        self.joint_zeros = np.array([j.config.joint_zero for j in self.joints])
+        self.no_encoder = np.array([j.no_encoder for j in self.joints])
+        self.states = AxisStateTracker()
 
     def joint(self, joint_name: str) -> Joint:
-        joint_numbers = [j.verbose_name for j in self.joints]
-        idx = joint_numbers.index(joint_name)
-        return self.joints[idx]
+        return self.joints_by_name[joint_name]
 
     def search_by_can_node(self, node_id: int) -> Joint:
-        node_ids = [j.config.can_node_id for j in self.joints]
-        idx = node_ids.index(node_id)
-        return self.joints[idx]
+        return self.joints_by_node[node_id]
+
+    def snapshot(self):
+        return self.store.snapshot()
+
+    async def await_state(self, node_id: int, state: int, timeout: float) -> float:
+        return await self.states.await_state(node_id, state, timeout)
+
+    def convert_to_joint_positions(self, angles: np.ndarray) -> np.ndarray:
+        zero = self.joint_zeros
+        abs_angles = np.where(angles >= zero, angles - zero, 3599 - (zero - angles))
+        return np.where(abs_angles < 1800, abs_angles, abs_angles - 3599)
+
+    @property
+    def current_joint_positions(self) -> np.ndarray:
+        from_output = self.convert_to_joint_positions(self.store.column('output_angle'))
+        # without an output encoder output_angle is the homing switch, go by the motor count instead
+        from_count = (self.store.column('shadow_count') - self.zero_positions_in_count) / self.multipliers
+        return np.where(self.no_encoder, from_count, from_output)
+
+    @property
+    def zero_positions_in_count(self) -> np.ndarray:
+        home_count = self.store.column('home_count')
+        initial = self.convert_to_joint_positions(self.store.column('output_angle_initial'))
+        zero = np.where(self.no_encoder, 0.0, -initial * self.multipliers)
+        return np.where(np.nan_to_num(home_count) != 0, home_count, zero)
+
+    def convert_angles_to_counts(self, target_angles) -> np.ndarray:
+        return self.zero_positions_in_count + np.asarray(target_angles, dtype=float) * self.multipliers
 
     @staticmethod
-    def initialize_joints(skip=None):
-        joints = list()
+    def load_joint_defs(skip=None) -> List[JointDef]:
         with open(os.path.join(cur_dir, 'configs', 'joints.yaml'), encoding='utf-8') as infile:
             config_dict = yaml.safe_load(infile)
             joint_configs = from_dict(JointConfig, config_dict)
-        for joint_def in joint_configs.joints:
-            if skip and "j" + joint_def.name in skip:
-                continue
-            joints.append(Joint(joint_def))
-        joints = sorted(joints, key=attrgetter('joint_number'))
-
-        return tuple(joints)
+        joint_defs = [joint_def for joint_def in joint_configs.joints
+                      if not (skip and "j" + joint_def.name in skip)]
+        return sorted(joint_defs, key=lambda joint_def: int(joint_def.name))
 
 
 if __name__ == '__main__':
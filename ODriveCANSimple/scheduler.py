@@ -0,0 +1,164 @@
+import asyncio
+from collections import OrderedDict
+from itertools import count
+from typing import Callable, Dict, Optional, Sequence, Tuple, Union
+
+LANE_SAFETY = 0
+LANE_MOTION = 1
+LANE_TELEMETRY = 2
+LANE_NAMES = ('safety', 'motion', 'telemetry')
+
+COMMAND_LANES = {
+    'state': LANE_SAFETY,
+    'woffset': LANE_SAFETY,
+    'roffset': LANE_SAFETY,
+    'setpos': LANE_MOTION,
+    'setpos_ff': LANE_MOTION,
+    'settrajacc': LANE_MOTION,
+    'heartbeat': LANE_TELEMETRY,
+    'encoder': LANE_TELEMETRY,
+}
+# only the latest of these per node is worth putting on the bus, both are the same position setpoint
+COALESCED_COMMANDS = {'setpos': 'setpos', 'setpos_ff': 'setpos'}
+BATCH_KEY = ('batch',)
+
+Item = Union[str, Tuple[str, ...]]
+
+
+def parse_command(command: str) -> Tuple[str, str]:
+    node_id, cmd_name, *_ = command.split(" ", 2) + [""]
+    return node_id, cmd_name
+
+
+class CommandScheduler:
+    """Drop-in replacement for the command asyncio.Queue with one FIFO lane per priority.
+
+    Lanes are served in strict priority order, or by weight when `weights` is given, in which
+    case the safety lane still always goes first. Telemetry is the only bounded lane. Items are
+    single command strings, or tuples of them queued with put_batch().
+    """
+
+    def __init__(self, telemetry_maxsize=32, weights: Optional[Sequence[int]] = None):
+        self.lanes = tuple(OrderedDict() for _ in LANE_NAMES)
+        self.telemetry_maxsize = telemetry_maxsize
+        self.weights = tuple(weights) if weights else None
+        self.credits = list(self.weights) if weights else None
+        self.keys = count()
+        self.ready = asyncio.Event()
+        self.space = asyncio.Event()
+        self.enqueued = [0] * len(LANE_NAMES)
+        self.dequeued = [0] * len(LANE_NAMES)
+        self.coalesced = [0] * len(LANE_NAMES)
+        self.on_enqueue = None  # type: Optional[Callable[[str, str], None]]
+
+    @staticmethod
+    def lane_of(command: str) -> int:
+        _, cmd_name = parse_command(command.strip())
+        return COMMAND_LANES.get(cmd_name, LANE_MOTION)
+
+    def full(self):
+        return len(self.lanes[LANE_TELEMETRY]) >= self.telemetry_maxsize
+
+    def qsize(self):
+        return sum(len(lane) for lane in self.lanes)
+
+    def __len__(self):
+        return self.qsize()
+
+    async def put(self, command: str, lane: Optional[int] = None):
+        lane = self.lane_of(command) if lane is None else lane
+        while lane == LANE_TELEMETRY and self.full():
+            self.space.clear()
+            await self.space.wait()
+        self.put_nowait(command, lane)
+
+    def put_nowait(self, command: str, lane: Optional[int] = None):
+        lane = self.lane_of(command) if lane is None else lane
+        if lane == LANE_TELEMETRY and self.full():
+            raise asyncio.QueueFull
+        node_id, cmd_name = parse_command(command.strip())
+        queued = self.lanes[lane]
+        if cmd_name in COALESCED_COMMANDS:
+            key = (COALESCED_COMMANDS[cmd_name], node_id)
+            # re-append rather than update in place, the newest setpoint has to go out last
+            if queued.pop(key, None) is not None:
+                self.coalesced[lane] += 1
+        else:
+            key = next(self.keys)
+        queued[key] = command
+        self.enqueued[lane] += 1
+        if self.on_enqueue is not None:
+            self.on_enqueue(node_id, cmd_name)
+        self.ready.set()
+
+    def put_batch(self, commands: Sequence[str], lane=LANE_MOTION) -> Tuple:
+        """Queues commands that must go out in a single write, returns the batch key.
+
+        In the motion lane a newer batch replaces one that is still queued, and per-node setpoints
+        it supersedes are dropped from the lane. Batches in the other lanes (e.g. state changes)
+        are appended, so a queued idle can never be replaced by a later batch.
+        """
+        queued = self.lanes[lane]
+        parsed = [parse_command(command.strip()) for command in commands]
+        for node_id, cmd_name in parsed:
+            if cmd_name not in COALESCED_COMMANDS:
+                continue
+            if queued.pop((COALESCED_COMMANDS[cmd_name], node_id), None) is not None:
+                self.coalesced[lane] += 1
+        if lane == LANE_MOTION:
+            key = BATCH_KEY
+            if queued.pop(key, None) is not None:
+                self.coalesced[lane] += 1
+        else:
+            key = BATCH_KEY + (next(self.keys),)
+        queued[key] = tuple(commands)
+        self.enqueued[lane] += 1
+        if self.on_enqueue is not None:
+            for node_id, cmd_name in parsed:
+                self.on_enqueue(node_id, cmd_name)
+        self.ready.set()
+        return key
+
+    def batch_pending(self, lane=LANE_MOTION, key: Optional[Tuple] = None):
+        queued = self.lanes[lane]
+        if key is not None or lane == LANE_MOTION:
+            return (key or BATCH_KEY) in queued
+        return any(isinstance(queued_key, tuple) and queued_key[:1] == BATCH_KEY for queued_key in queued)
+
+    async def get(self) -> Item:
+        while not self.qsize():
+            self.ready.clear()
+            await self.ready.wait()
+        return self.get_nowait()
+
+    def get_nowait(self) -> Item:
+        lane = self.select_lane()
+        if lane is None:
+            raise asyncio.QueueEmpty
+        _, command = self.lanes[lane].popitem(last=False)
+        self.dequeued[lane] += 1
+        if lane == LANE_TELEMETRY:
+            self.space.set()
+        return command
+
+    def select_lane(self) -> Optional[int]:
+        pending = [lane for lane, queued in enumerate(self.lanes) if queued]
+        if not pending:
+            return None
+        if self.weights is None or pending[0] == LANE_SAFETY:
+            return pending[0]
+        for _ in range(2):
+            for lane in pending:
+                if self.credits[lane] > 0:
+                    self.credits[lane] -= 1
+                    return lane
+            self.credits = list(self.weights)
+        return pending[0]
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        return {name: dict(queued=len(self.lanes[lane]), enqueued=self.enqueued[lane],
+                           dequeued=self.dequeued[lane], coalesced=self.coalesced[lane])
+                for lane, name in enumerate(LANE_NAMES)}
+
+    def __repr__(self):
+        return "{}:{}".format(self.__class__.__name__, [len(lane) for lane in self.lanes])
@@ -0,0 +1,290 @@
+"""Stand-in for the SLCAN adapter and the ODrive nodes behind it.
+
+Either attach a SimulatedCANTransport to a protocol in-process, or run this module to expose
+the simulated bus and the output encoder feed on two ptys:
+
+    python -m ODriveCANSimple.simulator --nodes 6 --latency 0.002 --jitter 0.001 --loss 0.01
+    python -m ODriveCANSimple.control_server --can-port <adapter pty> --encoder-port <encoder pty>
+"""
+import argparse
+import asyncio
+import os
+import random
+import time
+from typing import Dict, List, Optional, Sequence
+
+import ODriveCANSimple.enums as enums
+from ODriveCANSimple.can_interface import COMMANDS_BY_CODE, COMMANDS_BY_NAME, decode_sCAN, encode_slcan
+from ODriveCANSimple.framing import REMOTE_FRAME, SLCANFrameScanner
+from ODriveCANSimple.robot import RoboticArm
+
+UART_BITS_PER_CHAR = 10
+DEFAULT_CPR = 8192
+ENCODER_FEED_RATE = 50.0
+DYNAMICS_RATE = 500.0
+ACK = b'z\r'
+
+
+class SimulatedAxis:
+    """One axis: follows its position setpoint in closed loop, holds still otherwise."""
+
+    def __init__(self, node_id: int, cpr=DEFAULT_CPR, max_velocity=50000.0, max_acceleration=200000.0, gain=40.0):
+        self.node_id = node_id
+        self.cpr = cpr
+        self.max_velocity = max_velocity
+        self.max_acceleration = max_acceleration
+        self.gain = gain
+        self.state = enums.AXIS_STATE_IDLE
+        self.error = 0
+        self.position = 0.0
+        self.velocity = 0.0
+        self.setpoint = 0.0
+        self.vel_ff = 0.0
+        self.offset = 0
+        self.encoder_ready = 0
+
+    def step(self, dt: float):
+        if self.state != enums.AXIS_STATE_CLOSED_LOOP_CONTROL:
+            self.velocity = 0.0
+            return
+        wanted = self.vel_ff + self.gain * (self.setpoint - self.position)
+        wanted = max(-self.max_velocity, min(self.max_velocity, wanted))
+        max_change = self.max_acceleration * dt
+        self.velocity += max(-max_change, min(max_change, wanted - self.velocity))
+        self.position += self.velocity * dt
+
+    def request_state(self, state: int):
+        if state == enums.AXIS_STATE_CLOSED_LOOP_CONTROL:
+            self.setpoint = self.position
+            self.vel_ff = 0.0
+        self.state = state
+
+    def __repr__(self):
+        return "{}:{} state={} pos={:.0f}".format(self.__class__.__name__, self.node_id, self.state, self.position)
+
+
+class SimulatedBus:
+    """Answers SLCAN frames on behalf of a set of axes.
+
+    Frames are lost with probability `loss` before reaching the node, and every reply is
+    delayed by `latency` plus up to `jitter` seconds and by the time it needs on the serial
+    line back to the host.
+    """
+
+    def __init__(self, node_ids: Sequence[int], latency=0.002, jitter=0.0, loss=0.0, baudrate=115200, seed=None,
+                 axis_kwargs: Optional[Dict] = None):
+        self.axes = {node_id: SimulatedAxis(node_id, **(axis_kwargs or {})) for node_id in node_ids}
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.char_time = UART_BITS_PER_CHAR / baudrate
+        self.random = random.Random(seed)
+        self.scanner = SLCANFrameScanner()
+        self.line_free_at = 0.0
+        self.received = 0
+        self.lost = 0
+        self.replied = 0
+        self.last_step = None  # type: Optional[float]
+
+    def feed(self, data: bytes) -> List[bytes]:
+        """Processes whatever the host wrote, returns the reply frames to send back."""
+        replies = []
+        for frame in self.scanner.feed(data):
+            self.received += 1
+            if self.loss and self.random.random() < self.loss:
+                self.lost += 1
+                continue
+            reply = self.handle(frame)
+            if reply is not None:
+                replies.append(reply)
+        return replies
+
+    def handle(self, frame: bytes) -> Optional[bytes]:
+        if frame[0] == REMOTE_FRAME:
+            can_id = int(frame[1:4], 16)
+            node_id, cmd_code = can_id >> 5, can_id & 0x1f
+        else:
+            node_id, cmd_code, payload = decode_sCAN(frame)
+        axis = self.axes.get(node_id)
+        if axis is None:
+            return None
+        self.step(time.monotonic())
+        if frame[0] == REMOTE_FRAME:
+            return self.answer(axis, cmd_code)
+        cmd = COMMANDS_BY_CODE.get(cmd_code)
+        if cmd is None:
+            return None
+        values = cmd.param_struct.unpack_from(payload)
+        if cmd_code == enums.MSG_SET_POS_SETPOINT:
+            axis.setpoint = values[0]
+            axis.vel_ff = values[1] / 10.0
+        elif cmd_code == enums.MSG_SET_AXIS_REQUESTED_STATE:
+            axis.request_state(values[0])
+        elif cmd_code == enums.MSG_SET_ENCODER_OFFSET:
+            axis.offset = values[0]
+            axis.encoder_ready = 1
+        return None
+
+    def answer(self, axis: SimulatedAxis, cmd_code: int) -> Optional[bytes]:
+        if cmd_code == enums.MSG_GET_ODRIVE_HEARTBEAT:
+            cmd, values = COMMANDS_BY_NAME['heartbeat'], (axis.error, axis.state)
+        elif cmd_code == enums.MSG_GET_ENCODER_COUNT:
+            cmd, values = COMMANDS_BY_NAME['encoder'], (int(axis.position), axis.cpr)
+        elif cmd_code == enums.MSG_GET_ENCODER_OFFSET:
+            cmd, values = COMMANDS_BY_NAME['roffset'], (axis.offset, axis.encoder_ready)
+        else:
+            return None
+        self.replied += 1
+        return encode_slcan((axis.node_id << 5) + cmd.response_code, cmd.response_struct.pack(*values))
+
+    def step(self, now: float):
+        if self.last_step is not None and now > self.last_step:
+            dt = now - self.last_step
+            for axis in self.axes.values():
+                axis.step(dt)
+        self.last_step = now
+
+    def reply_delay(self, reply: bytes, now: float) -> float:
+        jitter = self.random.uniform(0.0, self.jitter) if self.jitter else 0.0
+        # replies share one serial line, a burst leaves at the line rate
+        ready = now + self.latency + jitter
+        self.line_free_at = max(self.line_free_at, ready) + len(reply) * self.char_time
+        return self.line_free_at - now
+
+    def stats(self):
+        return dict(received=self.received, lost=self.lost, replied=self.replied)
+
+
+class SimulatedSerial:
+    rts = False
+
+
+class SimulatedCANTransport(asyncio.Transport):
+    """In-process replacement for the serial_asyncio transport of CANUartServer."""
+
+    def __init__(self, bus: SimulatedBus, protocol: asyncio.Protocol, loop=None, ack=True):
+        super().__init__()
+        self.bus = bus
+        self.protocol = protocol
+        self.loop = loop or asyncio.get_event_loop()
+        self.serial = SimulatedSerial()
+        self.ack = ack
+        self.closing = False
+        self.bytes_written = 0
+
+    def write(self, data):
+        if self.closing:
+            return
+        self.bytes_written += len(data)
+        now = time.monotonic()
+        if self.ack:
+            self.loop.call_soon(self.protocol.data_received, ACK)
+        for reply in self.bus.feed(bytes(data)):
+            self.loop.call_later(self.bus.reply_delay(reply, now), self.deliver, reply)
+
+    def deliver(self, reply: bytes):
+        if not self.closing:
+            self.protocol.data_received(reply)
+
+    def get_write_buffer_size(self):
+        return 0
+
+    def is_closing(self):
+        return self.closing
+
+    def close(self):
+        self.closing = True
+
+
+def connect(protocol: asyncio.Protocol, bus: SimulatedBus, loop=None) -> SimulatedCANTransport:
+    transport = SimulatedCANTransport(bus, protocol, loop)
+    protocol.connection_made(transport)
+    return transport
+
+
+class EncoderFeed:
+    """Produces the output encoder UART lines ('jN:motor/output') from the simulated axes."""
+
+    def __init__(self, bus: SimulatedBus, joints, rate=ENCODER_FEED_RATE):
+        self.bus = bus
+        self.joints = list(joints)
+        self.rate = rate
+        self.start_counts = {joint.config.can_node_id: bus.axes[joint.config.can_node_id].position
+                             for joint in self.joints if joint.config.can_node_id in bus.axes}
+
+    def lines(self) -> bytes:
+        self.bus.step(time.monotonic())
+        lines = []
+        for joint in self.joints:
+            axis = self.bus.axes.get(joint.config.can_node_id)
+            if axis is None:
+                continue
+            moved = (axis.position - self.start_counts[axis.node_id]) / joint.multiplier
+            output_angle = int(round(joint.config.joint_zero + moved)) % 3600
+            motor_angle = int(axis.position) % 4096
+            lines.append("{}:{}/{}\n".format(joint.verbose_name, motor_angle, output_angle))
+        return "".join(lines).encode()
+
+    async def run(self, protocol: asyncio.Protocol):
+        while True:
+            protocol.data_received(self.lines())
+            await asyncio.sleep(1.0 / self.rate)
+
+
+class PtyWriter(asyncio.Protocol):
+    """Writes what the encoder feed produces to a pty, dropping it while nobody reads the other end."""
+
+    def __init__(self, fd: int):
+        self.fd = fd
+        self.dropped = 0
+        os.set_blocking(fd, False)
+
+    def data_received(self, data: bytes):
+        try:
+            os.write(self.fd, data)
+        except BlockingIOError:
+            self.dropped += 1
+
+
+async def serve_pty(bus: SimulatedBus, joints=()):
+    loop = asyncio.get_event_loop()
+    master, slave = os.openpty()
+    print('simulated SLCAN adapter on', os.ttyname(slave))
+    if joints:
+        encoder_master, encoder_slave = os.openpty()
+        print('simulated encoder UART on', os.ttyname(encoder_slave))
+        loop.create_task(EncoderFeed(bus, joints).run(PtyWriter(encoder_master)))
+
+    def send(reply: bytes):
+        os.write(master, reply)
+
+    def read():
+        now = time.monotonic()
+        data = os.read(master, 4096)
+        os.write(master, ACK)
+        for reply in bus.feed(data):
+            loop.call_later(bus.reply_delay(reply, now), send, reply)
+
+    loop.add_reader(master, read)
+    while True:
+        await asyncio.sleep(5)
+        print('simulator', bus.stats())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--nodes', type=int, default=6)
+    parser.add_argument('--latency', type=float, default=0.002)
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--loss', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+    bus = SimulatedBus(range(1, args.nodes + 1), args.latency, args.jitter, args.loss, seed=args.seed)
+    try:
+        asyncio.get_event_loop().run_until_complete(serve_pty(bus, RoboticArm().joints))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
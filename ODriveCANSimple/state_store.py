@@ -0,0 +1,146 @@
+import time
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+
+FIELDS = (
+    'error',
+    'axis_state',
+    'requested_state',
+    'shadow_count',
+    'shadow_count_initial',
+    'cpr',
+    'cpr_initial',
+    'motor_angle',
+    'output_angle',
+    'output_angle_initial',
+    'offset_setpoint',
+    'offset_actual',
+    'encoder_ready_setpoint',
+    'encoder_ready_actual',
+    'home_count',
+)
+FIELD_INDEX = {field: idx for idx, field in enumerate(FIELDS)}  # type: Dict[str, int]
+# fields that Joint.reset_state() forgets
+RESET_FIELDS = (
+    'axis_state', 'requested_state', 'shadow_count', 'shadow_count_initial', 'cpr', 'cpr_initial',
+    'offset_setpoint', 'offset_actual', 'encoder_ready_setpoint', 'encoder_ready_actual',
+)
+# telemetry served by robot:state, and the CAN poll that refreshes each (None: streamed over UART)
+TELEMETRY_FIELDS = {
+    'shadow_count': 'encoder',
+    'cpr': 'encoder',
+    'error': 'heartbeat',
+    'axis_state': 'heartbeat',
+    'motor_angle': None,
+    'output_angle': None,
+}
+
+
+class ArmSnapshot:
+    def __init__(self, version: int, data: np.ndarray, names: Sequence[str]):
+        self.version = version
+        self.taken_at = time.monotonic()
+        self.data = data
+        self.names = tuple(names)
+
+    def __getitem__(self, field: str) -> np.ndarray:
+        return self.data[FIELD_INDEX[field]]
+
+    def as_dict(self):
+        return {name: {field: as_value(self.data[idx, slot]) for idx, field in enumerate(FIELDS)}
+                for slot, name in enumerate(self.names)}
+
+    def __repr__(self):
+        return "{}:v{}".format(self.__class__.__name__, self.version)
+
+
+def as_value(value: float) -> Optional[int]:
+    # every stored quantity is integral, NaN stands in for None
+    if value != value:
+        return None
+    return int(value)
+
+
+class JointStateStore:
+    """Struct-of-arrays state for every joint: one float64 row per field, one column per slot.
+
+    `updated_at` has the same shape and holds the monotonic time of each field's last write.
+    """
+
+    def __init__(self, size: int, names: Optional[Sequence[str]] = None):
+        self.size = size
+        self.names = tuple(names) if names is not None else tuple(str(slot) for slot in range(size))
+        self.data = np.full((len(FIELDS), size), np.nan)
+        self.updated_at = np.full((len(FIELDS), size), np.nan)
+        self.version = 0
+
+    def get(self, field_idx: int, slot: int) -> Optional[int]:
+        return as_value(self.data.item(field_idx, slot))
+
+    def set(self, field_idx: int, slot: int, value):
+        self.data[field_idx, slot] = np.nan if value is None else value
+        self.updated_at[field_idx, slot] = time.monotonic()
+        self.version += 1
+
+    def column(self, field: str) -> np.ndarray:
+        return self.data[FIELD_INDEX[field]]
+
+    def reset(self, slot: int, fields: Sequence[str] = RESET_FIELDS):
+        rows = [FIELD_INDEX[field] for field in fields]
+        self.data[rows, slot] = np.nan
+        self.updated_at[rows, slot] = np.nan
+        self.version += 1
+
+    def age(self, field: str, slot: int, now=None) -> Optional[float]:
+        """Seconds since `field` was last written for `slot`, None if it never was or was reset."""
+        updated_at = self.updated_at.item(FIELD_INDEX[field], slot)
+        if updated_at != updated_at:
+            return None
+        return (time.monotonic() if now is None else now) - updated_at
+
+    def snapshot(self) -> ArmSnapshot:
+        return ArmSnapshot(self.version, self.data.copy(), self.names)
+
+    def __repr__(self):
+        return "{}:{}x{},v{}".format(self.__class__.__name__, len(FIELDS), self.size, self.version)
+
+
+class StoredField:
+    def __init__(self, field: str):
+        self.field_idx = FIELD_INDEX[field]
+
+    def __get__(self, joint, owner):
+        if joint is None:
+            return self
+        return joint.store.get(self.field_idx, joint.slot)
+
+    def __set__(self, joint, value):
+        joint.store.set(self.field_idx, joint.slot, value)
+
+
+class SetpointActualView:
+    def __init__(self, store: JointStateStore, slot: int, setpoint_field: str, actual_field: str):
+        self.store = store
+        self.slot = slot
+        self.setpoint_idx = FIELD_INDEX[setpoint_field]
+        self.actual_idx = FIELD_INDEX[actual_field]
+
+    @property
+    def setpoint(self):
+        return self.store.get(self.setpoint_idx, self.slot)
+
+    @setpoint.setter
+    def setpoint(self, value):
+        self.store.set(self.setpoint_idx, self.slot, value)
+
+    @property
+    def actual(self):
+        return self.store.get(self.actual_idx, self.slot)
+
+    @actual.setter
+    def actual(self, value):
+        self.store.set(self.actual_idx, self.slot, value)
+
+    def __repr__(self):
+        return "SetpointActual(setpoint={!r}, actual={!r})".format(self.setpoint, self.actual)
@@ -0,0 +1,83 @@
+import asyncio
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+from ODriveCANSimple.enums import AXIS_STATE_IDLE
+from ODriveCANSimple.exceptions import ODriveCANAxisError, ODriveCANTimeout
+
+MAX_TRANSITIONS = 256
+
+
+class StateTransition:
+    __slots__ = ('node_id', 'previous', 'state', 'timestamp')
+
+    def __init__(self, node_id: int, previous: Optional[int], state: int, timestamp: float):
+        self.node_id = node_id
+        self.previous = previous
+        self.state = state
+        self.timestamp = timestamp
+
+    def __repr__(self):
+        return "node {} {}->{} @{:.3f}".format(self.node_id, self.previous, self.state, self.timestamp)
+
+
+class AxisStateTracker:
+    """Follows the axis state reported in each node's heartbeat.
+
+    Transitions are kept with their monotonic timestamps, and await_state() resolves on the
+    heartbeat that reports the awaited state, or fails on the first one reporting an axis error.
+    A faulted axis drops to idle with its error still set, so an idle wait only looks at the state.
+    """
+
+    def __init__(self, max_transitions=MAX_TRANSITIONS):
+        self.states = dict()  # type: Dict[int, int]
+        self.errors = dict()  # type: Dict[int, int]
+        self.updated_at = dict()  # type: Dict[int, float]
+        self.transitions = deque(maxlen=max_transitions)  # type: Deque[StateTransition]
+        self.waiters = dict()  # type: Dict[int, List[Tuple[int, asyncio.Future]]]
+        self.on_wait = None  # type: Optional[Callable[[int], None]]
+
+    def update(self, node_id: int, error: int, state: int):
+        now = time.monotonic()
+        previous = self.states.get(node_id)
+        self.states[node_id] = state
+        self.errors[node_id] = error
+        self.updated_at[node_id] = now
+        if previous != state:
+            self.transitions.append(StateTransition(node_id, previous, state, now))
+        waiters = self.waiters.get(node_id)
+        if not waiters:
+            return
+        remaining = []
+        for awaited, fut in waiters:
+            if fut.done():
+                continue
+            if error and awaited != AXIS_STATE_IDLE:
+                fut.set_exception(ODriveCANAxisError(node_id, error))
+            elif state == awaited:
+                fut.set_result(now)
+            else:
+                remaining.append((awaited, fut))
+        self.waiters[node_id] = remaining
+
+    async def await_state(self, node_id: int, state: int, timeout: float) -> float:
+        """Waits for a heartbeat from `node_id` reporting `state`, returns its timestamp."""
+        fut = asyncio.get_event_loop().create_future()
+        self.waiters.setdefault(node_id, []).append((state, fut))
+        if self.on_wait is not None:
+            self.on_wait(node_id)
+        try:
+            return await asyncio.wait_for(fut, timeout)
+        except asyncio.TimeoutError:
+            raise ODriveCANTimeout("node {} not in state {} after {}s (state {})".format(
+                node_id, state, timeout, self.states.get(node_id)))
+
+    def state(self, node_id: int) -> Optional[int]:
+        return self.states.get(node_id)
+
+    def history(self, node_id: Optional[int] = None) -> List[StateTransition]:
+        return [t for t in self.transitions if node_id is None or t.node_id == node_id]
+
+    def __repr__(self):
+        return "{}:{}".format(self.__class__.__name__, self.states)
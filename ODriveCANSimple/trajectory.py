@@ -0,0 +1,158 @@
+import asyncio
+import time
+from typing import Callable, Optional, Sequence
+
+import numpy as np
+
+from ODriveCANSimple.can_interface import VEL_FF_SCALE
+from ODriveCANSimple.poller import link_frame_rate
+
+DEFAULT_RATE = 40.0  # fits six joints at 115200 baud, see max_stream_rate()
+MIN_RATE = 1.0
+STREAM_SHARE = 0.5  # of the serial link, the rest stays with telemetry polling
+START_LEAD = 0.005  # seconds between precomputing and the first tick
+FINAL_TICK_RETRIES = 5  # periods the final setpoint waits for a busy link before it is queued anyway
+INT16_MIN, INT16_MAX = -0x8000, 0x7fff
+
+
+def max_stream_rate(baudrate, joints, share=STREAM_SHARE) -> float:
+    """Highest tick rate whose setpoint frames (one per joint) fit in `share` of the serial link."""
+    return link_frame_rate(baudrate) * share / joints
+
+
+def velocity_feedforward(setpoints: np.ndarray, rate: float) -> np.ndarray:
+    """Per-tick VelFF values for setpos_ff from a (ticks, joints) array of counts.
+
+    The int16 field saturates at +-3276.7 counts/s, beyond that the axis controller has to
+    make up the difference as before; see feedforward_saturated().
+    """
+    if len(setpoints) < 2:
+        return np.zeros(np.shape(setpoints), dtype=int)
+    velocities = np.gradient(setpoints, 1.0 / rate, axis=0)
+    velocities[-1] = 0.0  # come to rest on the final setpoint
+    return np.clip(np.rint(velocities * VEL_FF_SCALE), INT16_MIN, INT16_MAX).astype(int)
+
+
+def feedforward_saturated(feedforward: np.ndarray) -> int:
+    return int(np.count_nonzero((feedforward == INT16_MIN) | (feedforward == INT16_MAX)))
+
+
+class Trajectory:
+    """Piecewise linear joint-space path through waypoints (one row of joint angles per time)."""
+
+    def __init__(self, times: Sequence[float], waypoints):
+        self.times = np.asarray(times, dtype=float)
+        self.waypoints = np.atleast_2d(np.asarray(waypoints, dtype=float))
+        if self.times.ndim != 1 or len(self.times) != len(self.waypoints):
+            raise ValueError("need one time per waypoint")
+        if len(self.times) < 2 or np.any(np.diff(self.times) <= 0):
+            raise ValueError("waypoint times must be increasing")
+
+    @property
+    def duration(self):
+        return self.times[-1] - self.times[0]
+
+    def sample(self, rate: float) -> np.ndarray:
+        ticks = np.arange(self.times[0], self.times[-1], 1.0 / rate)
+        ticks = np.append(ticks, self.times[-1])
+        return np.column_stack([np.interp(ticks, self.times, column) for column in self.waypoints.T])
+
+    @classmethod
+    def parse(cls, tokens: Sequence[str]) -> 'Trajectory':
+        # '<t>:<angle>,<angle>,...' per waypoint
+        times, waypoints = [], []
+        for token in tokens:
+            t, angles = token.split(":")
+            times.append(float(t))
+            waypoints.append([float(angle) for angle in angles.split(",")])
+        return cls(times, waypoints)
+
+
+class StreamStats:
+    def __init__(self, rate: float, ticks: int):
+        self.rate = rate
+        self.ticks = ticks
+        self.sent = 0
+        self.dropped = 0
+        self.late = 0
+        self.forced = 0
+        self.ff_saturated = 0  # sent joint setpoints whose VelFF hit the int16 limit
+        self.lateness = []
+        self.started_at = None
+        self.finished_at = None
+
+    def record(self, lateness: float):
+        self.sent += 1
+        self.lateness.append(lateness)
+        if lateness > 1.0 / self.rate:
+            self.late += 1
+
+    def as_dict(self):
+        lateness = np.asarray(self.lateness) * 1000.0 if self.lateness else np.zeros(1)
+        elapsed = (self.finished_at or time.monotonic()) - (self.started_at or time.monotonic())
+        return dict(rate=self.rate, ticks=self.ticks, sent=self.sent, dropped=self.dropped, late=self.late,
+                    forced=self.forced, ff_saturated=self.ff_saturated,
+                    elapsed=round(elapsed, 4), jitter_mean_ms=round(float(lateness.mean()), 3),
+                    jitter_p99_ms=round(float(np.percentile(lateness, 99)), 3),
+                    jitter_max_ms=round(float(lateness.max()), 3))
+
+    def __repr__(self):
+        return " ".join("{}={}".format(k, v) for k, v in self.as_dict().items())
+
+
+class TrajectoryStreamer:
+    """Sends one setpoint row per tick from a drift-free monotonic schedule.
+
+    Tick i is due at start + i / rate regardless of when earlier ticks went out. Ticks that
+    are already a full period overdue, or that find the link still busy with the previous
+    one, are dropped rather than queued; the final setpoint is always delivered, after at most
+    FINAL_TICK_RETRIES periods of waiting for the link (counted as `forced` when it had to be).
+    """
+
+    def __init__(self, send: Callable[[np.ndarray, Optional[np.ndarray]], None],
+                 link_busy: Callable[[], bool] = lambda: False, max_rate=1000.0):
+        self.send = send
+        self.link_busy = link_busy
+        self.max_rate = max_rate
+        self.stats = None  # type: StreamStats
+
+    async def stream(self, setpoints: np.ndarray, rate: float = DEFAULT_RATE,
+                     feedforward: Optional[np.ndarray] = None) -> StreamStats:
+        if not MIN_RATE <= rate <= self.max_rate:
+            raise ValueError("rate must be between {} and {:.1f} Hz".format(MIN_RATE, self.max_rate))
+        period = 1.0 / rate
+        last = len(setpoints) - 1
+        stats = self.stats = StreamStats(rate, len(setpoints))
+        start = stats.started_at = time.monotonic() + START_LEAD
+        tick = 0
+        retries = 0
+        while tick <= last:
+            delay = start + tick * period - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            lateness = time.monotonic() - (start + tick * period)
+            if lateness >= period and tick < last:
+                skipped = min(int(lateness // period), last - tick)
+                stats.dropped += skipped
+                tick += skipped
+                continue
+            if self.link_busy():
+                if tick < last:
+                    stats.dropped += 1
+                    tick += 1
+                    continue
+                if retries < FINAL_TICK_RETRIES:
+                    retries += 1
+                    await asyncio.sleep(period)
+                    start += period
+                    continue
+                stats.forced += 1
+            if feedforward is None:
+                self.send(setpoints[tick], None)
+            else:
+                self.send(setpoints[tick], feedforward[tick])
+                stats.ff_saturated += feedforward_saturated(feedforward[tick])
+            stats.record(lateness)
+            tick += 1
+        stats.finished_at = time.monotonic()
+        return stats
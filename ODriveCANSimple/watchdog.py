@@ -0,0 +1,169 @@
+import asyncio
+import math
+import time
+from typing import Dict, Hashable, List, Optional, Tuple
+
+from ODriveCANSimple.scheduler import LANE_SAFETY
+
+WHEEL_TICK = 0.01  # seconds per wheel slot, also the staleness detection resolution
+WHEEL_SLOTS = 512
+DEFAULT_TIMEOUTS = {'heartbeat': 1.5}  # heartbeats are polled at 2 Hz when idle
+SCOPE_AFFECTED = 'affected'
+SCOPE_ALL = 'all'
+IDLE_STATE = 1  # AXIS_STATE_IDLE
+
+
+class TimerWheel:
+    """Hashed timer wheel: O(1) schedule, advance() only visits the slots that have elapsed."""
+
+    def __init__(self, tick=WHEEL_TICK, slots=WHEEL_SLOTS):
+        self.tick = tick
+        self.slots = [[] for _ in range(slots)]  # type: List[List[Tuple[int, Hashable]]]
+        self.current = None  # type: Optional[int]
+
+    def schedule(self, key: Hashable, deadline: float):
+        idx = math.ceil(deadline / self.tick)
+        if self.current is not None:
+            idx = max(idx, self.current + 1)
+        self.slots[idx % len(self.slots)].append((idx, key))
+
+    def advance(self, now: float) -> List[Hashable]:
+        target = int(now / self.tick)
+        if self.current is None:
+            self.current = target - 1
+        expired = []
+        for idx in range(self.current + 1, self.current + 1 + min(target - self.current, len(self.slots))):
+            slot = self.slots[idx % len(self.slots)]
+            if not slot:
+                continue
+            # entries more than a turn ahead stay in the slot
+            expired.extend(key for due, key in slot if due <= target)
+            slot[:] = [(due, key) for due, key in slot if due > target]
+        self.current = max(self.current, target)
+        return expired
+
+
+class Reaction:
+    __slots__ = ('node_ids', 'reason', 'fault_at', 'queued_at', 'written_at', 'batch_key')
+
+    def __init__(self, node_ids: List[int], reason: str, fault_at: float, queued_at: float, batch_key: Tuple = None):
+        self.node_ids = node_ids
+        self.reason = reason
+        self.fault_at = fault_at
+        self.queued_at = queued_at
+        self.written_at = None  # type: Optional[float]
+        self.batch_key = batch_key
+
+    @property
+    def latency(self) -> float:
+        return (self.written_at or self.queued_at) - self.fault_at
+
+    def __repr__(self):
+        return "{} -> idle {} in {:.1f}ms{}".format(self.reason, self.node_ids, self.latency * 1000.0,
+                                                    "" if self.written_at else " (queued)")
+
+
+class Watchdog:
+    """Idles axes through the safety lane when a node faults or stops answering.
+
+    Every (node, message) pair is armed on the wheel when run() starts, or when it is first
+    seen if that is earlier, so a node that never answers trips as well. Feeding it only
+    records the time; when the wheel fires the entry is re-armed from the last feed, or trips
+    if nothing arrived within the timeout. Latency runs from the fault (the heartbeat carrying
+    an error, or the moment a message became overdue) to the write of the idle frames.
+    """
+
+    def __init__(self, scheduler, node_ids, timeouts: Optional[Dict[str, float]] = None, scope=SCOPE_ALL,
+                 tick=WHEEL_TICK):
+        self.scheduler = scheduler
+        self.node_ids = [int(node_id) for node_id in node_ids]
+        self.timeouts = DEFAULT_TIMEOUTS if timeouts is None else timeouts
+        self.scope = scope
+        self.wheel = TimerWheel(tick)
+        self.last_seen = dict()  # type: Dict[Tuple[int, str], float]
+        self.tripped = set()
+        self.reactions = []  # type: List[Reaction]
+        self.awaiting_write = dict()  # type: Dict[Tuple, List[Reaction]]
+        self.max_latency = 0.0
+
+    def feed(self, node_id: int, cmd_name: str, now=None):
+        timeout = self.timeouts.get(cmd_name)
+        if timeout is None:
+            return
+        now = time.monotonic() if now is None else now
+        key = (node_id, cmd_name)
+        if key not in self.last_seen:
+            self.wheel.schedule(key, now + timeout)
+        self.last_seen[key] = now
+        self.tripped.discard(key)
+
+    def arm(self, now=None):
+        # counts as a feed for every configured pair that hasn't been seen yet
+        now = time.monotonic() if now is None else now
+        for node_id in self.node_ids:
+            for cmd_name, timeout in self.timeouts.items():
+                if (node_id, cmd_name) not in self.last_seen:
+                    self.wheel.schedule((node_id, cmd_name), now + timeout)
+                    self.last_seen[(node_id, cmd_name)] = now
+
+    def fault(self, node_id: int, error: int, now=None):
+        key = (node_id, 'error')
+        if key in self.tripped:
+            return
+        self.tripped.add(key)
+        self.react(node_id, "node {} error {}".format(node_id, error), time.monotonic() if now is None else now)
+
+    def clear_fault(self, node_id: int):
+        self.tripped.discard((node_id, 'error'))
+
+    def check(self, now=None):
+        now = time.monotonic() if now is None else now
+        for key in self.wheel.advance(now):
+            deadline = self.last_seen[key] + self.timeouts[key[1]]
+            if deadline > now:
+                self.wheel.schedule(key, deadline)
+                continue
+            # keep watching, a node that comes back is fed and re-armed from its reply
+            self.wheel.schedule(key, now + self.timeouts[key[1]])
+            if key in self.tripped:
+                continue
+            self.tripped.add(key)
+            node_id, cmd_name = key
+            self.react(node_id, "node {} {} stale".format(node_id, cmd_name), deadline)
+
+    def react(self, node_id: int, reason: str, fault_at: float):
+        node_ids = self.node_ids if self.scope == SCOPE_ALL else [node_id]
+        # an idle for these axes may already be waiting for the link
+        batch_key = next((key for key, reactions in self.awaiting_write.items()
+                          if self.scheduler.batch_pending(LANE_SAFETY, key)
+                          and set(node_ids) <= set(reactions[0].node_ids)), None)
+        if batch_key is None:
+            batch_key = self.scheduler.put_batch(["{} state {}".format(node, IDLE_STATE) for node in node_ids],
+                                                 LANE_SAFETY)
+        reaction = Reaction(node_ids, reason, fault_at, time.monotonic(), batch_key)
+        self.reactions.append(reaction)
+        self.awaiting_write.setdefault(batch_key, []).append(reaction)
+        print('watchdog:', reason)
+
+    def frames_written(self, now=None):
+        # called by the CAN link after each write while a reaction is outstanding
+        written = [key for key in self.awaiting_write if not self.scheduler.batch_pending(LANE_SAFETY, key)]
+        if not written:
+            return
+        now = time.monotonic() if now is None else now
+        for key in written:
+            for reaction in self.awaiting_write.pop(key):
+                reaction.written_at = now
+                self.max_latency = max(self.max_latency, reaction.latency)
+
+    async def run(self):
+        self.arm()
+        while True:
+            await asyncio.sleep(self.wheel.tick)
+            self.check()
+
+    def stats(self):
+        last = self.reactions[-1] if self.reactions else None
+        return dict(watched=len(self.last_seen), tripped=sorted(map(str, self.tripped)), reactions=len(self.reactions),
+                    awaiting_write=sum(map(len, self.awaiting_write.values())),
+                    last=repr(last) if last else None, max_latency_ms=round(self.max_latency * 1000.0, 3))
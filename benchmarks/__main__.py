@@ -0,0 +1,51 @@
+"""Hot path benchmarks.
+
+    python -m benchmarks --output results.json
+    python -m benchmarks --baseline results.json
+
+Exits with status 1 when a case's p50 regressed by more than --threshold against the baseline.
+"""
+import argparse
+import json
+import multiprocessing
+import platform
+import sys
+import time
+
+from benchmarks.cases import CASES, run_case
+from benchmarks.timing import DEFAULT_THRESHOLD, compare, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="control server hot path benchmarks")
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    parser.add_argument('--baseline', help='compare against results saved with --output')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help='allowed relative p50 slowdown')
+    parser.add_argument('--only', nargs='*', choices=list(CASES), help='run only these cases')
+    args = parser.parse_args()
+
+    results = dict()
+    context = multiprocessing.get_context('spawn')
+    for name in CASES:
+        if args.only and name not in args.only:
+            continue
+        with context.Pool(1) as pool:
+            results[name] = pool.apply(run_case, (name,))
+        print(name, results[name], file=sys.stderr)
+    report = dict(meta=dict(python=platform.python_version(), machine=platform.machine(),
+                            timestamp=time.strftime('%Y-%m-%dT%H:%M:%S')), results=results)
+    if args.output:
+        with open(args.output, 'w') as outfile:
+            json.dump(report, outfile, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+    if args.baseline:
+        with open(args.baseline) as infile:
+            baseline = json.load(infile)
+        print("\n".join(compare(report, baseline, args.threshold)), file=sys.stderr)
+        if regressions(report, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+import asyncio
+import contextlib
+import io
+import random
+import struct
+import time
+from collections import OrderedDict
+from typing import Callable, Dict
+
+import ODriveCANSimple.control_server as cs
+import ODriveCANSimple.enums as enums
+from ODriveCANSimple.can_interface import ODriveCANInterface, encode_slcan
+from ODriveCANSimple.framing import SLCANFrameScanner
+from ODriveCANSimple.simulator import SimulatedBus, connect
+from benchmarks.timing import per_call, summarize
+
+CASES = OrderedDict()  # type: OrderedDict[str, Callable[[], Dict]]
+
+
+def case(name):
+    def register(fn):
+        CASES[name] = fn
+        return fn
+    return register
+
+
+def encoder_reply(node_id, shadow_count=123456, cpr=8192) -> bytes:
+    return encode_slcan((node_id << 5) + enums.MSG_GET_ENCODER_COUNT, struct.pack('<ii', shadow_count, cpr))
+
+
+@case('codec_encode')
+def codec_encode():
+    interface = ODriveCANInterface()
+    tokens = ['3', 'setpos', '-123456']
+    return per_call(lambda: interface.encode_command(tokens))
+
+
+@case('codec_decode')
+def codec_decode():
+    interface = ODriveCANInterface()
+    frame = encoder_reply(3)[:-1]
+    return per_call(lambda: interface.process_response(frame))
+
+
+@case('frame_scan_chunked')
+def frame_scan_chunked():
+    # 1000 replies with interleaved acks, cut into serial-sized chunks of 1-64 bytes
+    rng = random.Random(0)
+    stream = b''.join(encoder_reply(rng.randint(1, 6), rng.randint(-10 ** 6, 10 ** 6)) + b'z\r'
+                      for _ in range(1000))
+    chunks, pos = [], 0
+    while pos < len(stream):
+        size = rng.randint(1, 64)
+        chunks.append(stream[pos:pos + size])
+        pos += size
+
+    def scan_all():
+        scanner = SLCANFrameScanner()
+        for chunk in chunks:
+            scanner.feed(chunk)
+    return per_call(scan_all, number=1, repeat=100, ops_per_call=1000, unit='ns/frame')
+
+
+@case('dispatch_encoder')
+def dispatch_encoder():
+    values = [123456, 8192]
+    dispatch = cs.dispatcher.dispatch
+    return per_call(lambda: dispatch(3, enums.MSG_GET_ENCODER_COUNT, values))
+
+
+class WireTimestamps(asyncio.Transport):
+    def __init__(self):
+        super().__init__()
+        self.serial = type('Serial', (), {'rts': False})()
+        self.written_at = []
+
+    def write(self, data):
+        self.written_at.append(time.perf_counter_ns())
+
+    def get_write_buffer_size(self):
+        return 0
+
+    def is_closing(self):
+        return False
+
+
+class DiscardTransport(asyncio.Transport):
+    def write(self, data):
+        pass
+
+    def get_extra_info(self, name, default=None):
+        return ('127.0.0.1', 0)
+
+    def is_closing(self):
+        return False
+
+
+@case('tcp_request_to_wire')
+def tcp_request_to_wire():
+    async def run(requests=2000):
+        can = cs.CANUartServer()
+        wire = WireTimestamps()
+        can.connection_made(wire)
+        cs.can_server = can
+        server = cs.IOServer()
+        server.connection_made(DiscardTransport())
+        samples = []
+        for idx in range(requests):
+            written = len(wire.written_at)
+            start = time.perf_counter_ns()
+            server.data_received(b'@%d can:3 setpos %d\n' % (idx, idx))
+            while len(wire.written_at) == written:
+                await asyncio.sleep(0)
+            samples.append(wire.written_at[-1] - start)
+        return summarize(samples)
+    return run_quietly(run())
+
+
+@case('poll_cycle_simulated')
+def poll_cycle_simulated():
+    async def run(duration=1.0):
+        bus = SimulatedBus(range(1, 7), latency=0.0, baudrate=10 ** 7)
+        can = cs.CANUartServer()
+        connect(can, bus)
+        cs.can_server = can
+        samples = []
+        deadline = time.monotonic() + duration
+        while time.monotonic() < deadline:
+            start = time.perf_counter_ns()
+            await asyncio.gather(*(cs.correlator.request(node_id, 'encoder') for node_id in range(1, 7)))
+            samples.append(time.perf_counter_ns() - start)
+        return summarize(samples, polls_per_s=round(6 * len(samples) / duration))
+    return run_quietly(run())
+
+
+def run_quietly(coroutine):
+    # the server prints on connect, keep the JSON on stdout clean
+    with contextlib.redirect_stdout(io.StringIO()):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        return loop.run_until_complete(coroutine)
+
+
+def run_case(name) -> Dict:
+    # the server's scheduler, correlator and dispatcher are module globals, so every case
+    # is run in a fresh interpreter (see __main__)
+    return CASES[name]()
@@ -0,0 +1,44 @@
+import time
+from typing import Callable, Dict, List
+
+import numpy as np
+
+DEFAULT_THRESHOLD = 0.2  # relative p50 slowdown reported as a regression
+
+
+def summarize(samples_ns: List[float], unit='ns', **extra) -> Dict:
+    samples = np.asarray(samples_ns, dtype=float)
+    summary = dict(unit=unit, n=len(samples), p50=round(float(np.percentile(samples, 50)), 1),
+                   p99=round(float(np.percentile(samples, 99)), 1), mean=round(float(samples.mean()), 1))
+    summary.update(extra)
+    return summary
+
+
+def per_call(fn: Callable[[], None], number=1000, repeat=50, ops_per_call=1, unit='ns') -> Dict:
+    """Times `repeat` batches of `number` calls, each sample is the mean ns per operation of one batch."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter_ns()
+        for _ in range(number):
+            fn()
+        samples.append((time.perf_counter_ns() - start) / (number * ops_per_call))
+    return summarize(samples, unit)
+
+
+def compare(current: Dict, baseline: Dict, threshold=DEFAULT_THRESHOLD) -> List[str]:
+    """Lines describing every case, those slower than the baseline by more than `threshold` are flagged."""
+    lines = []
+    for name, result in sorted(current['results'].items()):
+        base = baseline['results'].get(name)
+        if base is None:
+            lines.append("{:<24} new       p50={} p99={}".format(name, result['p50'], result['p99']))
+            continue
+        ratio = result['p50'] / base['p50'] if base['p50'] else float('inf')
+        status = "REGRESSED" if ratio > 1.0 + threshold else "ok"
+        lines.append("{:<24} {:<9} p50 {} -> {} ({:+.0%}) p99 {} -> {}".format(
+            name, status, base['p50'], result['p50'], ratio - 1.0, base['p99'], result['p99']))
+    return lines
+
+
+def regressions(current: Dict, baseline: Dict, threshold=DEFAULT_THRESHOLD) -> List[str]:
+    return [line.split()[0] for line in compare(current, baseline, threshold) if "REGRESSED" in line]
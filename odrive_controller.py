@@ -1,13 +1,15 @@
 from operator import attrgetter
 
 import odrive
-from time import sleep
+from time import sleep, monotonic
 import odrive.enums as ODRV
 import yaml
 import os
 from serial import Serial
 
 cur_dir = os.path.dirname(os.path.abspath(__file__))
+STATE_TIMEOUT = 0.5
+STATE_POLL_INTERVAL = 0.01
 uart = Serial(port="/dev/ttyJ1", baudrate=115200)
 
 
@@ -44,6 +46,15 @@ def receive_signal(ser):
     return data
 
 
+def wait_for_state(axis, state, timeout=STATE_TIMEOUT):
+    deadline = monotonic() + timeout
+    while axis.current_state != state and axis.error == 0:
+        if monotonic() >= deadline:
+            return False
+        sleep(STATE_POLL_INTERVAL)
+    return axis.error == 0
+
+
 def valid_amt_angle(angle):
     return 4096 > angle > -1
 
@@ -126,8 +137,7 @@ class Joint:
     def energize(self):
         if self.initialized:
             self.axis.requested_state = ODRV.AXIS_STATE_CLOSED_LOOP_CONTROL
-            sleep(0.5)
-            if self.axis.error == 0:
+            if wait_for_state(self.axis, ODRV.AXIS_STATE_CLOSED_LOOP_CONTROL):
                 self.energized = True
         # enter closed loop control
 
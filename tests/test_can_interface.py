@@ -0,0 +1,83 @@
+import random
+
+import pytest
+
+from ODriveCANSimple.can_interface import ODriveCANInterface, SUPPORTED_COMMANDS, find_command_definition_by_code
+from ODriveCANSimple.helper import as_ascii
+
+NODE_IDS = range(0x3f + 1)
+
+
+def legacy_encode(command_tokens) -> str:
+    # the packet by packet path the compiled codec replaced, kept here as the reference
+    node_id, cmd_name, *cmd_params = command_tokens
+    cmd_def = next(cmd for cmd in SUPPORTED_COMMANDS if cmd.name == cmd_name)
+    can_id_ascii = "{0:0{1}x}".format((int(node_id) << 5) + cmd_def.command_code, 3)
+    if cmd_def.call_and_response:
+        return 'T' + can_id_ascii + '8' + '\r'
+    payload = [0x00] * 8
+    ptr = 0
+    for param_def, param_str in zip(cmd_def.param_defs, cmd_params):
+        for i, datum in enumerate(param_def(param_str).pack()):
+            payload[ptr + i] = datum
+        ptr += param_def.bits
+    return 't' + can_id_ascii + '8' + "".join(as_ascii(byte) for byte in payload) + '\r'
+
+
+def legacy_decode(frame: str):
+    delimiters = [0, 1, 4, 5, 7, 9, 11, 13, 15, 17, 19, 21]
+    _, cmd_id_hex, _, *payload_hex = [frame[i:j] for i, j in zip(delimiters, delimiters[1:])]
+    payload = [int(item, 16) for item in payload_hex]
+    cmd_id = int(cmd_id_hex, 16)
+    cmd_code = cmd_id & 0b00000011111
+    values = []
+    for data_type in find_command_definition_by_code(cmd_code).response_defs:
+        values.append(data_type.unpack(payload[:data_type.bits]))
+        payload = payload[data_type.bits:]
+    return cmd_id >> 5, cmd_code, values
+
+
+def random_param(rng: random.Random, data_type) -> str:
+    if data_type.parser is float:
+        return repr(rng.uniform(-1e4, 1e4))
+    bits = 8 * data_type.bits
+    if data_type.format.endswith('I'):
+        return str(rng.randint(0, 2 ** bits - 1))
+    return str(rng.randint(-2 ** (bits - 1), 2 ** (bits - 1) - 1))
+
+
+def random_command(rng: random.Random):
+    cmd_def = rng.choice(SUPPORTED_COMMANDS)
+    param_defs = cmd_def.param_defs
+    # optional trailing params may be left out
+    count = rng.randint(cmd_def.required_param_count, len(param_defs))
+    return [str(rng.choice(NODE_IDS)), cmd_def.name] + [random_param(rng, param_def) for param_def in param_defs[:count]]
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_encode_matches_legacy(seed):
+    rng = random.Random(seed)
+    interface = ODriveCANInterface()
+    for _ in range(500):
+        tokens = random_command(rng)
+        assert interface.process_command(tokens) == legacy_encode(tokens), tokens
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_decode_matches_legacy(seed):
+    rng = random.Random(seed)
+    interface = ODriveCANInterface()
+    codes = sorted({cmd.response_code or cmd.command_code for cmd in SUPPORTED_COMMANDS if cmd.call_and_response})
+    for _ in range(500):
+        can_id = (rng.choice(NODE_IDS) << 5) + rng.choice(codes)
+        frame = 't%03x8%s' % (can_id, bytes(rng.randint(0, 255) for _ in range(8)).hex())
+        assert interface.process_response(frame) == legacy_decode(frame), frame
+
+
+def test_golden_frames():
+    interface = ODriveCANInterface()
+    assert interface.process_command(['3', 'setpos', '-123456']) == 't06c8c01dfeff00000000\r'
+    assert interface.process_command(['3', 'setpos_ff', '1000', '-20', '5']) == 't06c8e8030000ecff0500\r'
+    assert interface.process_command(['1', 'state', '8']) == 't02780800000000000000\r'
+    assert interface.process_command(['63', 'heartbeat']) == 'T7fd8\r'
+    assert interface.process_response('t06a8c01dfeff00200000') == (3, 0x0a, [-123456, 8192])
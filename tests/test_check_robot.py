@@ -0,0 +1,19 @@
+import socket
+
+from ODriveCANSimple.check_robot import read_replies
+
+
+def test_replies_are_read_past_published_events():
+    client, server = socket.socketpair()
+    with client, server:
+        server.sendall(b"heartbeat j1 0 8\n@1 ok\nencoder j2 1024 0\n@0 init ok\nerrors j3 ")
+        server.sendall(b"64\n")
+        assert read_replies(client, 2) == {0: "init ok", 1: "ok"}
+
+
+def test_reply_split_across_reads():
+    client, server = socket.socketpair()
+    with client, server:
+        server.sendall(b"heartbeat j1 0 8\n@0 sta")
+        server.sendall(b"te 8\n")
+        assert read_replies(client, 1) == {0: "state 8"}
@@ -0,0 +1,129 @@
+import random
+
+import pytest
+
+from ODriveCANSimple.framing import SLCANFrameScanner
+
+ACKS = (b'\r', b'z\r', b'Z\r')
+BEL = b'\x07'
+# no frame starts ('t', 'T'), acks ('\r', 'z', 'Z') or BEL, so each run is exactly one resync
+GARBAGE = b'!#$%&xy0123456789abcdef\n'
+
+
+def data_frame(rng: random.Random, dlc=None) -> bytes:
+    dlc = rng.randint(0, 8) if dlc is None else dlc
+    return b't%03x%d' % (rng.randint(0, 0x7ff), dlc) + bytes(rng.randint(0, 255) for _ in range(dlc)).hex().encode()
+
+
+def remote_frame(rng: random.Random) -> bytes:
+    return b'T%03x%d' % (rng.randint(0, 0x7ff), rng.randint(0, 8))
+
+
+class Corpus:
+    """A serial stream with the frames, BELs, garbage runs and truncated frames that went into it."""
+
+    def __init__(self, seed: int, frames=60):
+        rng = self.rng = random.Random(seed)
+        self.frames = []
+        self.bells = self.garbage = self.truncated = 0
+        chunks = []
+        for _ in range(frames):
+            frame = remote_frame(rng) if rng.random() < 0.3 else data_frame(rng)
+            noise = rng.random()
+            if noise < 0.15:
+                chunks.append(rng.choice(ACKS))
+            elif noise < 0.2:
+                chunks.append(BEL)
+                self.bells += 1
+            elif noise < 0.25:
+                chunks.append(bytes(rng.choice(GARBAGE) for _ in range(rng.randint(1, 30))))
+                self.garbage += 1
+            elif noise < 0.3:
+                # the adapter lost the end of a frame and the next full length frame runs into it,
+                # a shorter one could complete the fragment to a plausible frame
+                cut = data_frame(rng)
+                chunks.append(cut[:rng.randint(1, len(cut))])
+                self.truncated += 1
+                frame = data_frame(rng, 8)
+            chunks.append(frame + b'\r')
+            self.frames.append(frame)
+        self.stream = b''.join(chunks)
+
+    def split(self, max_chunk: int):
+        pos = 0
+        while pos < len(self.stream):
+            size = self.rng.randint(1, max_chunk)
+            yield self.stream[pos:pos + size]
+            pos += size
+
+
+def feed_all(scanner: SLCANFrameScanner, chunks):
+    frames = []
+    for chunk in chunks:
+        frames.extend(scanner.feed(chunk))
+    return frames
+
+
+@pytest.mark.parametrize('seed', range(200))
+def test_whole_stream(seed):
+    corpus = Corpus(seed)
+    scanner = SLCANFrameScanner()
+    assert scanner.feed(corpus.stream) == corpus.frames
+    assert scanner.frames == len(corpus.frames)
+    assert scanner.dropped == corpus.truncated
+    assert scanner.resyncs == corpus.garbage + corpus.truncated
+    assert scanner.errors == corpus.bells
+    assert not scanner.tail
+
+
+@pytest.mark.parametrize('seed', range(200))
+@pytest.mark.parametrize('max_chunk', [1, 7, 64])
+def test_random_chunk_boundaries(seed, max_chunk):
+    corpus = Corpus(seed)
+    scanner = SLCANFrameScanner()
+    assert feed_all(scanner, corpus.split(max_chunk)) == corpus.frames
+    assert scanner.frames == len(corpus.frames)
+    assert scanner.dropped == corpus.truncated
+    assert scanner.errors == corpus.bells
+    # a garbage run cut by a chunk boundary is resynced once per piece
+    assert scanner.resyncs >= corpus.garbage + corpus.truncated
+    assert not scanner.tail
+
+
+def test_frame_split_in_header():
+    scanner = SLCANFrameScanner()
+    assert scanner.feed(b'z\rt0') == []
+    assert scanner.feed(b'298') == []
+    assert scanner.feed(b'0102030405060708\rT03d8') == [b't02980102030405060708']
+    assert scanner.feed(b'\r') == [b'T03d8']
+    assert (scanner.dropped, scanner.resyncs, scanner.errors) == (0, 0, 0)
+
+
+def test_acks_and_bell_between_frames():
+    scanner = SLCANFrameScanner()
+    frames = scanner.feed(b'\rz\rZ\r\x07t0211aa\r\x07\x07T0218\r')
+    assert frames == [b't0211aa', b'T0218']
+    assert scanner.errors == 3
+    assert (scanner.dropped, scanner.resyncs) == (0, 0)
+
+
+def test_wrong_dlc_is_dropped():
+    scanner = SLCANFrameScanner()
+    assert scanner.feed(b't0218aabb\rt0211cc\r') == [b't0211cc']
+    assert (scanner.dropped, scanner.resyncs) == (1, 1)
+
+
+def test_truncated_frame_waits_then_resyncs():
+    scanner = SLCANFrameScanner()
+    assert scanner.feed(b't02980102') == []
+    assert scanner.tail == b't02980102'
+    assert scanner.feed(b't02980102030405060708\r') == [b't02980102030405060708']
+    assert (scanner.dropped, scanner.resyncs) == (1, 1)
+    assert not scanner.tail
+
+
+def test_garbage_without_frame_start_is_discarded():
+    scanner = SLCANFrameScanner()
+    assert scanner.feed(b'#0123 garbage, no frame here!\n' * 4) == []
+    assert not scanner.tail
+    assert scanner.feed(b't0211cc\r') == [b't0211cc']
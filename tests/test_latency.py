@@ -0,0 +1,30 @@
+from ODriveCANSimple.latency import BUCKET_COUNT, LatencyTracker, LogHistogram
+from ODriveCANSimple.scheduler import CommandScheduler, LANE_SAFETY
+
+
+def test_last_bucket_covers_ten_seconds():
+    assert LogHistogram.upper_bound(BUCKET_COUNT - 1) >= 10.0
+    histogram = LogHistogram()
+    histogram.record(9.0)
+    assert histogram.counts[-1] == 1
+
+
+def test_batched_requests_are_stamped_on_enqueue():
+    scheduler = CommandScheduler()
+    tracker = LatencyTracker()
+    scheduler.on_enqueue = tracker.enqueued
+    scheduler.put_batch(['1 heartbeat', '2 heartbeat'], LANE_SAFETY)
+    for node_id in (1, 2):
+        pending, = tracker.pending[(node_id, 'heartbeat')]
+        assert pending[0] is not None and pending[1] is None
+
+
+def test_report_includes_total():
+    scheduler = CommandScheduler()
+    tracker = LatencyTracker()
+    scheduler.on_enqueue = tracker.enqueued
+    scheduler.put_nowait('3 heartbeat')
+    tracker.written(3, 'heartbeat')
+    tracker.replied(3, 0x01)
+    line, = tracker.report()
+    assert ' total n=1 ' in line
@@ -0,0 +1,51 @@
+from ODriveCANSimple.scheduler import CommandScheduler, LANE_MOTION, LANE_SAFETY
+
+
+def drain(scheduler: CommandScheduler):
+    items = []
+    while scheduler.qsize():
+        items.append(scheduler.get_nowait())
+    return items
+
+
+def test_setpos_and_setpos_ff_coalesce_to_newest():
+    scheduler = CommandScheduler()
+    scheduler.put_nowait('3 setpos_ff 100 0 0')
+    scheduler.put_nowait('3 setpos 200')
+    scheduler.put_nowait('3 setpos_ff 300 0 0')
+    assert drain(scheduler) == ['3 setpos_ff 300 0 0']
+    assert scheduler.coalesced[LANE_MOTION] == 2
+
+
+def test_newest_setpoint_goes_out_last():
+    scheduler = CommandScheduler()
+    scheduler.put_nowait('3 setpos 100')
+    scheduler.put_nowait('4 setpos 100')
+    scheduler.put_nowait('3 setpos_ff 200 0 0')
+    assert drain(scheduler) == ['4 setpos 100', '3 setpos_ff 200 0 0']
+
+
+def test_batch_supersedes_queued_setpoints_of_either_kind():
+    scheduler = CommandScheduler()
+    scheduler.put_nowait('3 setpos 100')
+    scheduler.put_nowait('4 setpos_ff 100 0 0')
+    scheduler.put_nowait('5 setpos 100')
+    scheduler.put_batch(['3 setpos_ff 200 0 0', '4 setpos 200'])
+    assert drain(scheduler) == ['5 setpos 100', ('3 setpos_ff 200 0 0', '4 setpos 200')]
+
+
+def test_motion_batch_replaces_and_moves_to_the_end():
+    scheduler = CommandScheduler()
+    scheduler.put_batch(['3 setpos 100'])
+    scheduler.put_nowait('4 setpos 100')
+    scheduler.put_batch(['3 setpos 200'])
+    assert drain(scheduler) == ['4 setpos 100', ('3 setpos 200',)]
+
+
+def test_safety_batches_are_appended():
+    scheduler = CommandScheduler()
+    idle = scheduler.put_batch(['1 state 1', '2 state 1'], LANE_SAFETY)
+    scheduler.put_batch(['1 state 8', '2 state 8'], LANE_SAFETY)
+    assert scheduler.batch_pending(LANE_SAFETY, idle)
+    assert drain(scheduler) == [('1 state 1', '2 state 1'), ('1 state 8', '2 state 8')]
+    assert not scheduler.batch_pending(LANE_SAFETY)
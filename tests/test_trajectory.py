@@ -0,0 +1,24 @@
+import asyncio
+
+import numpy as np
+
+from ODriveCANSimple.trajectory import INT16_MAX, INT16_MIN, TrajectoryStreamer, velocity_feedforward
+
+
+def test_feedforward_saturates_at_int16():
+    # 0 -> 100000 counts in one 10 Hz tick is far past the +-3276.7 counts/s VelFF can carry
+    setpoints = np.array([[0, 0], [100000, -100000], [100000, -100000]])
+    feedforward = velocity_feedforward(setpoints, 10.0)
+    assert feedforward[0].tolist() == [INT16_MAX, INT16_MIN]
+    assert feedforward[-1].tolist() == [0, 0]
+
+
+def test_stream_counts_saturated_feedforward():
+    setpoints = np.array([[0, 0], [100000, 10], [100000, 20]])
+    sent = []
+    streamer = TrajectoryStreamer(lambda row, ff: sent.append((row.tolist(), ff.tolist())))
+    stats = asyncio.run(streamer.stream(setpoints, 200.0, velocity_feedforward(setpoints, 200.0)))
+    assert len(sent) + stats.dropped == 3
+    saturated = sum(value in (INT16_MIN, INT16_MAX) for _, ff in sent for value in ff)
+    assert stats.ff_saturated == saturated
+    assert stats.as_dict()['ff_saturated'] == saturated
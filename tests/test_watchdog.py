@@ -0,0 +1,43 @@
+from ODriveCANSimple.scheduler import CommandScheduler
+from ODriveCANSimple.watchdog import SCOPE_AFFECTED, Watchdog
+
+
+def write_next(scheduler: CommandScheduler, watchdog: Watchdog, now):
+    item = scheduler.get_nowait()
+    watchdog.frames_written(now)
+    return item
+
+
+def test_every_reaction_is_resolved_by_its_own_batch():
+    scheduler = CommandScheduler()
+    watchdog = Watchdog(scheduler, [1, 2], scope=SCOPE_AFFECTED)
+    watchdog.fault(1, 0x40, now=10.0)
+    watchdog.fault(2, 0x40, now=10.1)
+    assert write_next(scheduler, watchdog, 10.2) == ('1 state 1',)
+    first, second = watchdog.reactions
+    assert first.written_at == 10.2 and second.written_at is None
+    assert write_next(scheduler, watchdog, 10.5) == ('2 state 1',)
+    assert second.written_at == 10.5
+    assert not watchdog.awaiting_write
+    assert watchdog.max_latency == 10.5 - 10.1
+
+
+def test_reactions_share_a_queued_idle_batch():
+    scheduler = CommandScheduler()
+    watchdog = Watchdog(scheduler, [1, 2])
+    watchdog.fault(1, 0x40, now=10.0)
+    watchdog.fault(2, 0x40, now=10.1)
+    assert scheduler.qsize() == 1
+    assert write_next(scheduler, watchdog, 10.2) == ('1 state 1', '2 state 1')
+    assert [reaction.written_at for reaction in watchdog.reactions] == [10.2, 10.2]
+
+
+def test_node_that_never_answers_trips_after_arming():
+    scheduler = CommandScheduler()
+    watchdog = Watchdog(scheduler, [1, 2], timeouts={'heartbeat': 1.0}, scope=SCOPE_AFFECTED)
+    watchdog.arm(now=5.0)
+    watchdog.check(now=5.5)
+    watchdog.feed(1, 'heartbeat', now=5.5)
+    watchdog.check(now=6.2)
+    assert [reaction.node_ids for reaction in watchdog.reactions] == [[2]]
+    assert scheduler.get_nowait() == ('2 state 1',)